@@ -0,0 +1,100 @@
+"""
+Color index.
+
+Licensed under MIT
+Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
+
+A k-d tree over the CIE Lab coordinates of a palette, so the perceptually
+nearest colors can be found without comparing against every color.
+"""
+import heapq
+from .rgba import RGBA, LINEAR_CHANNELS
+
+# D65 reference white.
+WHITE_X = 0.95047
+WHITE_Y = 1.0
+WHITE_Z = 1.08883
+
+LAB_EPSILON = (6.0 / 29.0) ** 3
+LAB_SLOPE = 1.0 / (3.0 * (6.0 / 29.0) ** 2)
+LAB_OFFSET = 4.0 / 29.0
+
+
+def lab_f(t):
+    """Compress a CIE XYZ ratio for Lab."""
+
+    return t ** (1.0 / 3.0) if t > LAB_EPSILON else t * LAB_SLOPE + LAB_OFFSET
+
+
+def rgb_to_lab(color):
+    """Convert a hex color to CIE Lab, ignoring its alpha channel."""
+
+    rgba = RGBA(color)
+    r = LINEAR_CHANNELS[rgba.r]
+    g = LINEAR_CHANNELS[rgba.g]
+    b = LINEAR_CHANNELS[rgba.b]
+    fx = lab_f((0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / WHITE_X)
+    fy = lab_f((0.2126729 * r + 0.7151522 * g + 0.0721750 * b) / WHITE_Y)
+    fz = lab_f((0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / WHITE_Z)
+    return 116.0 * fy - 16.0, 500.0 * (fx - fy), 200.0 * (fy - fz)
+
+
+class ColorIndex(object):
+    """A k-d tree of colors in CIE Lab."""
+
+    def __init__(self, colors):
+        """Index the `(color, payload)` pairs."""
+
+        points = [(rgb_to_lab(color), color, payload) for color, payload in colors]
+        self.size = len(points)
+        self.root = self.build(points, 0)
+
+    def build(self, points, depth):
+        """Build the tree by splitting the points at the median of alternating axes."""
+
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        median = len(points) // 2
+        lab, color, payload = points[median]
+        return (
+            lab, color, payload, axis,
+            self.build(points[:median], depth + 1),
+            self.build(points[median + 1:], depth + 1)
+        )
+
+    def nearest(self, color, k=5):
+        """
+        Get the `k` nearest colors as `(distance, color, payload)`.
+
+        Distances are CIE76 delta E, and the closest colors are first.
+        """
+
+        if k <= 0 or self.root is None:
+            return []
+        target = rgb_to_lab(color)
+        # Max heap of the best matches so far, as negated squared distances.
+        best = []
+        count = 0
+        # Subtrees to visit with the least squared distance any of their colors can have.
+        stack = [(self.root, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if node is None or (len(best) == k and bound >= -best[0][0]):
+                continue
+            lab, found, payload, axis, left, right = node
+            dist = (lab[0] - target[0]) ** 2 + (lab[1] - target[1]) ** 2 + (lab[2] - target[2]) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-dist, count, found, payload))
+                count += 1
+            elif dist < -best[0][0]:
+                heapq.heapreplace(best, (-dist, count, found, payload))
+                count += 1
+
+            diff = target[axis] - lab[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, max(bound, diff * diff)))
+            stack.append((near, bound))
+
+        return [(d ** 0.5, found, payload) for d, _, found, payload in sorted((-d, c, f, p) for d, c, f, p in best)]
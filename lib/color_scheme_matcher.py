@@ -26,26 +26,323 @@ Algorithm has been split out into a separate library and been enhanced with a nu
 from __future__ import absolute_import
 import sublime
 import re
-from .rgba import RGBA
+from .rgba import RGBA, FilterChain, clamp, round_int, get_color_info, get_contrast_ratio
+from .scope_selector import compile_selector
+from .lru_cache import LRUCache
+from .color_index import ColorIndex
+import os
 from os import path
-from collections import namedtuple
-from plistlib import readPlistFromBytes
+import codecs
+import hashlib
+import json
+from collections import namedtuple, OrderedDict
+from .plist_stream import PlistStream
+from .file_strip.json import sanitize_json
 
 
 class SchemeColors(
     namedtuple(
         'SchemeColors',
-        ['fg', 'fg_simulated', 'bg', "bg_simulated", "style", "fg_selector", "bg_selector", "style_selectors"],
-        verbose=False
+        ['fg', 'fg_simulated', 'bg', "bg_simulated", "style", "fg_selector", "bg_selector", "style_selectors"]
     )
 ):
     """SchemeColors."""
 
 
-class SchemeSelectors(namedtuple('SchemeSelectors', ['name', 'scope'], verbose=False)):
+class SchemeSelectors(namedtuple('SchemeSelectors', ['name', 'scope'])):
     """SchemeSelectors."""
 
 
+STYLE_BOLD = 0x1
+STYLE_ITALIC = 0x2
+FONT_STYLES = (("bold", STYLE_BOLD), ("italic", STYLE_ITALIC))
+
+# Rule id of matches that fall back to the general colors or no style.
+NO_RULE = -1
+FG_SELECTORS = SchemeSelectors("foreground", "foreground")
+BG_SELECTORS = SchemeSelectors("background", "background")
+NO_SELECTORS = SchemeSelectors("", "")
+
+
+class SchemeRule(object):
+    """A color scheme rule with its font style as a bitmask."""
+
+    __slots__ = ('id', 'name', 'scope', 'color', 'bgcolor', 'style', 'selector', 'names', 'color_sim', 'bgcolor_sim')
+
+    def __init__(self, name, scope, color, bgcolor, style):
+        """Initialize."""
+
+        self.id = NO_RULE
+        self.name = name
+        self.scope = scope
+        self.color = color
+        self.bgcolor = bgcolor
+        self.style = style
+        self.selector = None
+        self.names = SchemeSelectors(name, scope)
+        # Simulated colors are resolved when the rule first wins a match.
+        self.color_sim = None
+        self.bgcolor_sim = None
+
+    @classmethod
+    def from_dict(cls, rule):
+        """Create the rule from its cached form."""
+
+        style = 0
+        for name, flag in FONT_STYLES:
+            if name in rule["style"]:
+                style |= flag
+        return cls(rule["name"], rule["scope"], rule["color"], rule["bgcolor"], style)
+
+    def to_dict(self):
+        """Get the cached form of the rule."""
+
+        return {
+            "name": self.name,
+            "scope": self.scope,
+            "color": self.color,
+            "bgcolor": self.bgcolor,
+            "style": [name for name, flag in FONT_STYLES if self.style & flag]
+        }
+
+    def __eq__(self, other):
+        """Compare the rule definitions."""
+
+        if not isinstance(other, SchemeRule):
+            return False
+        definition = (self.name, self.scope, self.color, self.bgcolor, self.style)
+        return definition == (other.name, other.scope, other.color, other.bgcolor, other.style)
+
+    def __ne__(self, other):
+        """Compare the rule definitions."""
+
+        return not self == other
+
+
+CACHE_VERSION = 2
+
+CONTRAST_CACHE_SIZE = 50
+
+# Contrast ratios of schemes, shared by all matchers with the same scheme content and filter.
+contrast_cache = LRUCache(CONTRAST_CACHE_SIZE)
+
+GENERAL_COLORS = (
+    'bground', 'bground_sim', 'fground', 'fground_sim', 'sbground', 'sbground_sim', 'sfground', 'sfground_sim',
+    'gbground', 'gbground_sim', 'gfground', 'gfground_sim', 'lumens', 'dark_lumens', 'is_dark_theme'
+)
+
+
+# General colors that every matched entry depends on.
+MATCHED_GENERAL_COLORS = (
+    'bground', 'bground_sim', 'fground', 'fground_sim', 'sbground', 'sbground_sim',
+    'sfground', 'sfground_sim', 'gbground', 'gbground_sim', 'gfground', 'gfground_sim'
+)
+
+# Names and attributes of the general colors included in the palette index.
+PALETTE_GENERAL_COLORS = (
+    ("background", "bground"),
+    ("foreground", "fground"),
+    ("selection", "sbground"),
+    ("selectionForeground", "sfground"),
+    ("gutter", "gbground"),
+    ("gutterForeground", "gfground")
+)
+
+JSON_GLOBALS = {
+    "background": "background",
+    "foreground": "foreground",
+    "selection": "selection",
+    "selection_foreground": "selectionForeground",
+    "gutter": "gutter",
+    "gutter_foreground": "gutterForeground"
+}
+
+RE_VARIABLE = re.compile(r'var\(\s*([-\w]+)\s*\)')
+RE_HEX = re.compile(r'^#(?:[A-Fa-f\d]{3}|[A-Fa-f\d]{6}|[A-Fa-f\d]{8})$')
+RE_RGB = re.compile(r'^rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*(?:,\s*([\d.]+%?)\s*)?\)$')
+RE_HSL = re.compile(
+    r'^hsla?\(\s*([\d.]+)(?:deg)?\s*,\s*([\d.]+)%\s*,\s*([\d.]+)%\s*(?:,\s*([\d.]+%?)\s*)?\)$'
+)
+RE_ADJUSTER = re.compile(r'^([a-z]+)\((.*)\)$', re.DOTALL)
+RE_ADJUSTER_VALUE = re.compile(r'^([-+*]?)\s*([\d.]+)(%?)$')
+RE_BLEND = re.compile(r'^(.*?)\s+([\d.]+)%$', re.DOTALL)
+
+
+def resolve_variables(variables):
+    """Resolve the references between color scheme variables into a flat table."""
+
+    resolved = {}
+
+    def resolve(name, seen):
+        """Resolve a variable, guarding against circular references."""
+
+        if name in resolved:
+            return resolved[name]
+        value = variables.get(name)
+        if not isinstance(value, str) or name in seen:
+            return None
+        seen.add(name)
+        value = RE_VARIABLE.sub(lambda m: resolve(m.group(1), seen) or m.group(0), value)
+        seen.discard(name)
+        resolved[name] = value
+        return value
+
+    for name in variables:
+        resolve(name, set())
+    return resolved
+
+
+def split_color_mod(value):
+    """Split the content of `color()` on the white space that is not in parentheses."""
+
+    parts = []
+    depth = 0
+    start = 0
+    for index, c in enumerate(value):
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c.isspace() and depth == 0:
+            if index > start:
+                parts.append(value[start:index])
+            start = index + 1
+    if value[start:]:
+        parts.append(value[start:])
+    return parts
+
+
+def adjust_value(current, adjustment, scale):
+    """
+    Apply an adjuster's value to the current value.
+
+    Values are absolute, or relative when prefixed with `+`, `-`, or `*`.
+    Percentages are scaled down by `scale`.
+    """
+
+    m = RE_ADJUSTER_VALUE.match(adjustment.strip())
+    if m is None:
+        raise ValueError('Invalid adjuster value: %s' % adjustment)
+    op, number, percent = m.groups()
+    number = float(number)
+    if percent:
+        number /= scale
+    if op == '+':
+        return current + number
+    elif op == '-':
+        return current - number
+    elif op == '*':
+        return current * number
+    return number
+
+
+def blend_colors(rgba, color, percent, alpha):
+    """Blend the color into the base color, keeping `percent` of the base color."""
+
+    factor = clamp(percent / 100.0, 0.0, 1.0)
+    other = RGBA(color)
+    rgba.r = round_int(rgba.r * factor + other.r * (1.0 - factor))
+    rgba.g = round_int(rgba.g * factor + other.g * (1.0 - factor))
+    rgba.b = round_int(rgba.b * factor + other.b * (1.0 - factor))
+    if alpha:
+        rgba.a = round_int(rgba.a * factor + other.a * (1.0 - factor))
+
+
+def translate_color_mod(value, variables):
+    """
+    Translate a `color()` color modification to a hex color.
+
+    The base color is adjusted by each of the `alpha()` (`a()`), `blend()`,
+    `blenda()`, `lightness()` (`l()`), and `saturation()` (`s()`) adjusters
+    in turn.
+    """
+
+    parts = split_color_mod(value[6:-1].strip())
+    base = translate_color(parts[0], variables) if parts else None
+    if base is None:
+        return None
+
+    rgba = RGBA(base)
+    try:
+        for adjuster in parts[1:]:
+            m = RE_ADJUSTER.match(adjuster)
+            if m is None:
+                return None
+            name, args = m.group(1), m.group(2).strip()
+            if name in ('alpha', 'a'):
+                rgba.a = round_int(clamp(adjust_value(rgba.a / 255.0, args, 100.0), 0.0, 1.0) * 255.0)
+            elif name in ('blend', 'blenda'):
+                m = RE_BLEND.match(args)
+                color = translate_color(m.group(1), variables) if m is not None else None
+                if color is None:
+                    return None
+                blend_colors(rgba, color, float(m.group(2)), name == 'blenda')
+            elif name in ('lightness', 'l'):
+                h, l, s = rgba.tohls()
+                rgba.fromhls(h, clamp(adjust_value(l, args, 100.0), 0.0, 1.0), s)
+            elif name in ('saturation', 's'):
+                h, l, s = rgba.tohls()
+                rgba.fromhls(h, l, clamp(adjust_value(s, args, 100.0), 0.0, 1.0))
+            else:
+                return None
+    except ValueError:
+        return None
+    return rgba.get_rgba() if rgba.a != 255 else rgba.get_rgb()
+
+
+def translate_color(value, variables):
+    """
+    Translate a `.sublime-color-scheme` color value to a hex color.
+
+    Hex, `rgb()`, `rgba()`, `hsl()`, and `hsla()` colors are understood, as
+    well as `color()` modifications of them.  Anything else yields `None`.
+    """
+
+    if isinstance(value, list):
+        # Gradients: use the first color.
+        value = value[0] if value else None
+    if not isinstance(value, str):
+        return None
+
+    value = RE_VARIABLE.sub(lambda m: variables.get(m.group(1), m.group(0)), value).strip()
+    if RE_HEX.match(value):
+        return value
+    if value.startswith('color(') and value.endswith(')'):
+        return translate_color_mod(value, variables)
+
+    alpha = None
+    m = RE_RGB.match(value)
+    if m:
+        rgba = RGBA('#%02X%02X%02X' % tuple(min(int(c), 255) for c in m.group(1, 2, 3)))
+        alpha = m.group(4)
+    else:
+        m = RE_HSL.match(value)
+        if m is None:
+            return None
+        rgba = RGBA()
+        rgba.fromhls(
+            (float(m.group(1)) % 360.0) / 360.0,
+            min(float(m.group(3)), 100.0) / 100.0,
+            min(float(m.group(2)), 100.0) / 100.0
+        )
+        alpha = m.group(4)
+
+    if alpha is None:
+        return rgba.get_rgb()
+    factor = float(alpha[:-1]) / 100.0 if alpha.endswith('%') else float(alpha)
+    rgba.a = round_int(min(factor, 1.0) * 255.0)
+    return rgba.get_rgba()
+
+
+def normalize_color(color):
+    """Normalize a hex color to `#RRGGBBAA` so differently written colors compare equal."""
+
+    color = color.replace(" ", "")
+    if RGBA.color_pattern.match(color) is None:
+        return color
+    return RGBA(color).get_rgba()
+
+
 def sublime_format_path(pth):
     """Format path for sublime internal use."""
 
@@ -55,32 +352,163 @@ def sublime_format_path(pth):
     return pth.replace("\\", "/")
 
 
+class SimilarColor(namedtuple('SimilarColor', ['color', 'distance', 'sources'])):
+    """SimilarColor."""
+
+
+class ContrastRule(namedtuple('ContrastRule', ['name', 'scope', 'fg', 'bg', 'ratio'])):
+    """ContrastRule."""
+
+
+class ContrastReport(namedtuple('ContrastReport', ['threshold', 'default', 'rules', 'failing'])):
+    """ContrastReport."""
+
+
 class ColorSchemeMatcher(object):
     """Determine color scheme colors and style for text in a Sublime view buffer."""
 
-    def __init__(self, scheme_file, ignore_gutter=False, track_dark_background=False, color_filter=None):
+    def __init__(
+        self, scheme_file, ignore_gutter=False, track_dark_background=False, color_filter=None, cache_size=1000,
+        cache_dir=None
+    ):
         """Initialize."""
+
+        if isinstance(color_filter, (list, tuple)):
+            color_filter = FilterChain(color_filter)
+        # Filtered schemes can't be identified by their content alone,
+        # so they are only cached if the filter has a signature.
+        filtered = color_filter is not None
+        signature = getattr(color_filter, 'signature', None)
+        cacheable = cache_dir is not None and (not filtered or signature is not None)
         if color_filter is None:
             color_filter = self.filter
         self.color_scheme = path.normpath(scheme_file)
-        self.scheme_file = path.basename(self.color_scheme)
-        self.plist_file = color_filter(
-            readPlistFromBytes(
-                re.sub(
-                    br"^[\r\n\s]*<!--[\s\S]*?-->[\s\r\n]*|<!--[\s\S]*?-->", b'',
-                    sublime.load_binary_resource(sublime_format_path(self.color_scheme))
-                )
-            )
-        )
         self.scheme_file = scheme_file
+        self.is_json = path.splitext(self.color_scheme)[1].lower() == '.sublime-color-scheme'
         self.ignore_gutter = ignore_gutter
         self.track_dark_background = track_dark_background
         self.dark_lumens = None
         self.lumens = None
-        self.matched = {}
+        # Scope key -> the `(fg, bg, bold, italic)` ids of the winning rules.
+        self.matched = LRUCache(cache_size, self.forget_matched)
+        # Match results are shared by all the scopes with the same winning rules.
+        self.match_results = {}
+        # Rule id -> the matched scope keys the rule won colors or style for.
+        self.rule_scopes = {}
         self.is_dark_theme = False
+        self.plist_file = None
+        self.rule_lumens = False
+        self.filter_signature = signature if filtered else ''
+        self.contrast_ratios = None
+        self.color_index = None
+
+        content = sublime.load_binary_resource(sublime_format_path(self.color_scheme))
+        self.scheme_hash = hashlib.sha1(content).hexdigest()
+        self.cache_file = None
+        if cacheable:
+            key = '%s:%s:%s' % (self.color_scheme, ignore_gutter, track_dark_background)
+            if signature is not None:
+                key += ':' + signature
+            self.cache_file = path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+        if not self.load_cache():
+            if not filtered and not self.is_json:
+                # Stream the rules straight into the colors mapping.
+                self.begin_scheme()
+                PlistStream(self.add_setting).parse(content)
+                self.end_scheme()
+            else:
+                self.plist_file = color_filter(self.read_plist(content))
+                self.parse_scheme()
+            self.save_cache()
+
+    def read_plist(self, content):
+        """Read the whole plist from the scheme content."""
+
+        if self.is_json:
+            return self.read_json(content)
+        return PlistStream().parse(content)
+
+    def read_json(self, content):
+        """
+        Read a `.sublime-color-scheme` into the same layout as a plist scheme.
+
+        Variables are resolved once up front, so each rule only needs lookups.
+        """
 
-        self.parse_scheme()
+        text = content.decode('utf-8-sig')
+        try:
+            # Strict JSON doesn't need to be sanitized.
+            scheme = json.loads(text)
+        except ValueError:
+            scheme = json.loads(sanitize_json(text))
+        variables = resolve_variables(scheme.get('variables', {}))
+
+        general = {}
+        for key, value in scheme.get('globals', {}).items():
+            color = translate_color(value, variables) if key in JSON_GLOBALS else None
+            if color is not None:
+                general[JSON_GLOBALS[key]] = color
+        settings = [{"settings": general}]
+
+        for rule in scheme.get('rules', []):
+            item = {"name": rule.get('name', ''), "settings": {}}
+            if 'scope' in rule:
+                item['scope'] = rule['scope']
+            for key in ('foreground', 'background'):
+                color = translate_color(rule.get(key), variables)
+                if color is not None:
+                    item['settings'][key] = color
+            if isinstance(rule.get('font_style'), str):
+                item['settings']['fontStyle'] = rule['font_style']
+            settings.append(item)
+
+        return {"name": scheme.get('name', ''), "settings": settings}
+
+    def load_cache(self):
+        """Load the parsed scheme from the cache if it is still current."""
+
+        if self.cache_file is None or not path.exists(self.cache_file):
+            return False
+        try:
+            with codecs.open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if (cache['version'], cache['path'], cache['hash']) != (CACHE_VERSION, self.color_scheme, self.scheme_hash):
+                # Stale, it will be rebuilt.
+                return False
+            general = [(key, cache['general'][key]) for key in GENERAL_COLORS]
+            colors = OrderedDict((rule['scope'], SchemeRule.from_dict(rule)) for rule in cache['colors'])
+        except Exception:
+            # Unreadable, truncated, or malformed, it will be rebuilt.
+            return False
+        for key, value in general:
+            setattr(self, key, value)
+        self.colors = colors
+        self.index_selectors()
+        return True
+
+    def save_cache(self):
+        """Save the parsed scheme to the cache."""
+
+        if self.cache_file is None:
+            return
+        cache = {
+            'version': CACHE_VERSION,
+            'path': self.color_scheme,
+            'hash': self.scheme_hash,
+            'general': dict((key, getattr(self, key)) for key in GENERAL_COLORS),
+            'colors': [rule.to_dict() for rule in self.colors.values()]
+        }
+        try:
+            cache_dir = path.dirname(self.cache_file)
+            if not path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            temp = self.cache_file + '.tmp'
+            with codecs.open(temp, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(temp, self.cache_file)
+        except Exception:
+            pass
 
     def filter(self, plist):
         """Dummy filter call that does nothing."""
@@ -90,11 +518,47 @@ class ColorSchemeMatcher(object):
     def parse_scheme(self):
         """Parse the color scheme."""
 
-        color_settings = {}
+        self.begin_scheme()
         for item in self.plist_file["settings"]:
-            if item.get('scope', None) is None and item.get('name', None) is None:
-                color_settings = item["settings"]
-                break
+            self.add_setting(item)
+        self.end_scheme()
+
+    def begin_scheme(self):
+        """Prepare to receive the color scheme settings."""
+
+        self.colors = OrderedDict()
+        # Rules seen before the general colors wait here as they are needed to simulate transparency.
+        self.pending = []
+
+    def add_setting(self, item):
+        """Add an entry of the color scheme's settings array."""
+
+        if self.pending is None:
+            self.add_rule(item)
+        elif item.get('scope', None) is None and item.get('name', None) is None:
+            self.parse_general(item.get('settings', {}))
+            self.flush_pending()
+        else:
+            self.pending.append(item)
+
+    def end_scheme(self):
+        """Finish parsing the color scheme."""
+
+        if self.pending is not None:
+            self.parse_general({})
+            self.flush_pending()
+        self.index_selectors()
+
+    def flush_pending(self):
+        """Add the rules that were waiting on the general colors."""
+
+        pending = self.pending
+        self.pending = None
+        for item in pending:
+            self.add_rule(item)
+
+    def parse_general(self, color_settings):
+        """Parse the general colors."""
 
         # Get general theme colors from color scheme file
         self.bground, self.bground_sim = self.strip_color(
@@ -123,33 +587,176 @@ class ColorSchemeMatcher(object):
         else:
             self.gfground_sim = self.fground_sim
 
-        # Create scope colors mapping from color scheme file
-        self.colors = {}
-        for item in self.plist_file["settings"]:
-            name = item.get('name', '')
-            scope = item.get('scope', None)
-            color = None
-            style = []
-            if 'settings' in item:
-                color = item['settings'].get('foreground', None)
-                bgcolor = item['settings'].get('background', None)
-                if 'fontStyle' in item['settings']:
-                    for s in item['settings']['fontStyle'].split(' '):
-                        if s == "bold" or s == "italic":  # or s == "underline":
-                            style.append(s)
-
-            if scope is not None and (color is not None or bgcolor is not None):
-                fg, fg_sim = self.strip_color(color)
-                bg, bg_sim = self.strip_color(bgcolor, bg=True)
-                self.colors[scope] = {
-                    "name": name,
-                    "scope": scope,
-                    "color": fg,
-                    "color_simulated": fg_sim,
-                    "bgcolor": bg,
-                    "bgcolor_simulated": bg_sim,
-                    "style": style
-                }
+    def add_rule(self, item):
+        """Add a scope rule to the colors mapping."""
+
+        name = item.get('name', '')
+        scope = item.get('scope', None)
+        color = None
+        bgcolor = None
+        style = 0
+        if 'settings' in item:
+            color = item['settings'].get('foreground', None)
+            bgcolor = item['settings'].get('background', None)
+            if 'fontStyle' in item['settings']:
+                for s in item['settings']['fontStyle'].split(' '):
+                    if s == "bold":
+                        style |= STYLE_BOLD
+                    elif s == "italic":  # or s == "underline":
+                        style |= STYLE_ITALIC
+
+        if scope is not None and (color is not None or bgcolor is not None):
+            self.colors[scope] = SchemeRule(
+                name,
+                scope,
+                color if color is not None and color.strip() != "" else None,
+                bgcolor if bgcolor is not None and bgcolor.strip() != "" else None,
+                style
+            )
+
+    def index_selectors(self):
+        """Index the rule selectors by the scope names they require."""
+
+        # Rules are identified by their position in `self.colors`.
+        self.rules = []
+        self.selector_index = {}
+        self.unindexed = []
+        self.color_rules = {}
+        for rule in self.colors.values():
+            rule.id = len(self.rules)
+            self.rules.append(rule)
+            for color in (rule.color, rule.bgcolor):
+                if color is not None:
+                    rules = self.color_rules.setdefault(normalize_color(color), [])
+                    if not rules or rules[-1] != rule.id:
+                        rules.append(rule.id)
+            rule.selector = compile_selector(rule.scope)
+            atoms = rule.selector.required()
+            if atoms is None:
+                self.unindexed.append(rule.id)
+            else:
+                for atom in atoms:
+                    self.selector_index.setdefault(atom, []).append(rule.id)
+
+    def get_color_rules(self, color):
+        """Get the rules that use the color for their foreground or background."""
+
+        return [self.rules[rule_id] for rule_id in self.color_rules.get(normalize_color(color), [])]
+
+    def get_color_index(self):
+        """
+        Get the spatial index of the scheme's palette.
+
+        Colors are placed by how they are seen, with transparency applied,
+        and carry the general color names and rule scopes that use them.
+        """
+
+        if self.color_index is None:
+            palette = OrderedDict()
+            for name, key in PALETTE_GENERAL_COLORS:
+                color = getattr(self, key)
+                if color is not None:
+                    palette.setdefault(normalize_color(color), []).append(name)
+            for color, rules in self.color_rules.items():
+                palette.setdefault(color, []).extend(self.rules[rule_id].scope for rule_id in rules)
+            bground = self.bground_sim if self.bground_sim != "" else "#FFFFFF"
+            self.color_index = ColorIndex(
+                (get_color_info(color, bground).simulated, (color, sources)) for color, sources in palette.items()
+            )
+        return self.color_index
+
+    def find_similar_colors(self, color, k=5):
+        """Get the `k` scheme colors that look the most like the given color, closest first."""
+
+        return [
+            SimilarColor(found, distance, sources)
+            for distance, _, (found, sources) in self.get_color_index().nearest(color.replace(" ", ""), k)
+        ]
+
+    def get_rule_scopes(self, rule_scope):
+        """Get the matched scopes the rule won colors or style for."""
+
+        rule = self.colors.get(rule_scope)
+        return set(self.rule_scopes.get(rule.id, ())) if rule is not None else set()
+
+    def remember_matched(self, scope_key, matched):
+        """Index a newly matched scope by the rules that won it."""
+
+        for rule_id in set(matched):
+            if rule_id != NO_RULE:
+                self.rule_scopes.setdefault(rule_id, set()).add(scope_key)
+
+    def forget_matched(self, scope_key, matched):
+        """Remove an evicted matched scope from the index."""
+
+        for rule_id in set(matched):
+            scopes = self.rule_scopes.get(rule_id)
+            if scopes is not None:
+                scopes.discard(scope_key)
+                if not scopes:
+                    del self.rule_scopes[rule_id]
+
+    def inherit_matched(self, previous, matched=None):
+        """
+        Carry over the matched scopes of a previous parse of the same scheme.
+
+        The rules are diffed, and only the scopes the changes could affect
+        are dropped: scopes the old version of a removed or changed rule
+        matched, as even a rule that won nothing can block lower scored
+        styles, and scopes a changed or added rule now matches.  If the
+        general colors or the order of the rules changed, nothing is kept.
+        Returns the number of matched scopes that were kept.
+
+        `matched` is a snapshot of the previous matched items.  It should be
+        taken on the thread that matches scopes with the previous object, as
+        the previous object's cache is only read through the snapshot.
+        """
+
+        if previous.color_scheme != self.color_scheme or any(
+            getattr(previous, key) != getattr(self, key) for key in MATCHED_GENERAL_COLORS
+        ):
+            return 0
+        old = previous.colors
+        if [key for key in old if key in self.colors] != [key for key in self.colors if key in old]:
+            # Moved rules change which of the equally scored rules wins.
+            return 0
+
+        changed = [rule for rule in self.rules if old.get(rule.scope) != rule]
+        # Old rule id -> new rule id, for the rules that are unchanged.
+        ids = {NO_RULE: NO_RULE}
+        for rule in previous.rules:
+            current = self.colors.get(rule.scope)
+            if current is not None and current == rule:
+                ids[rule.id] = current.id
+
+        # The old versions of the removed and changed rules.
+        changed.extend(rule for rule in previous.rules if rule.id not in ids)
+
+        if matched is None:
+            matched = previous.matched.items()
+        kept = 0
+        for scope_key, rule_ids in matched:
+            if any(rule_id not in ids for rule_id in rule_ids) or any(
+                rule.selector.score(scope_key) for rule in changed
+            ):
+                # Won by a removed or changed rule, or an old or new version of one matches.
+                continue
+            rule_ids = tuple(ids[rule_id] for rule_id in rule_ids)
+            rule_ids = self.match_results.setdefault(rule_ids, rule_ids)
+            self.remember_matched(scope_key, rule_ids)
+            self.matched[scope_key] = rule_ids
+            kept += 1
+        return kept
+
+    def get_candidates(self, scope_key):
+        """Get the ids of the rules that could match the given scope in the same order as `self.colors`."""
+
+        ids = set(self.unindexed)
+        for scope in scope_key.split():
+            parts = scope.split('.')
+            for i in range(1, len(parts) + 1):
+                ids.update(self.selector_index.get('.'.join(parts[:i]), []))
+        return sorted(ids)
 
     def strip_color(self, color, simple_strip=False, bg=False):
         """
@@ -163,16 +770,24 @@ class ColorSchemeMatcher(object):
         if color is None or color.strip() == "":
             return None, None
 
-        rgba = RGBA(color.replace(" ", ""))
-        if not simple_strip:
-            rgba.apply_alpha(self.bground_sim if self.bground_sim != "" else "#FFFFFF")
+        info = get_color_info(
+            color, None if simple_strip else (self.bground_sim if self.bground_sim != "" else "#FFFFFF")
+        )
 
-        self.lumens = rgba.get_luminance()
+        self.lumens = info.luminance
         if self.track_dark_background and bg:
             if self.dark_lumens is None or self.lumens < self.dark_lumens:
                 self.dark_lumens = self.lumens
 
-        return color, rgba.get_rgb()
+        return color, info.simulated
+
+    def simulate_color(self, color):
+        """Get the simulated color and its luminance from the shared color cache."""
+
+        if color is None:
+            return None, None
+        info = get_color_info(color, self.bground_sim if self.bground_sim != "" else "#FFFFFF")
+        return info.simulated, info.luminance
 
     def get_general_colors(self, simulate_transparency=False):
         """
@@ -191,83 +806,172 @@ class ColorSchemeMatcher(object):
     def get_darkest_lumen(self):
         """Get the darkest background lumen found."""
 
+        if self.track_dark_background and not self.rule_lumens:
+            # Rule backgrounds are only resolved when needed.
+            for rule in self.colors.values():
+                lumens = self.simulate_color(rule.bgcolor)[1]
+                if lumens is not None and (self.dark_lumens is None or lumens < self.dark_lumens):
+                    self.dark_lumens = lumens
+            self.rule_lumens = True
         return self.dark_lumens
 
+    def measure_contrast(self):
+        """Measure the contrast ratio of the default colors and every rule."""
+
+        bground = self.bground_sim if self.bground_sim != "" else "#FFFFFF"
+        pairs = {}
+
+        def measure(name, scope, fg, bg):
+            """Measure the colors as they are seen, with transparency applied."""
+
+            ratio = pairs.get((fg, bg))
+            if ratio is None:
+                bg_sim = get_color_info(bg, bground).simulated
+                ratio = get_contrast_ratio(get_color_info(fg, bg_sim).simulated, bg_sim)
+                pairs[(fg, bg)] = ratio
+            return ContrastRule(name, scope, fg, bg, ratio)
+
+        fground = self.fground if self.fground is not None else "#000000"
+        default = measure("", "", fground, self.bground)
+        rules = [
+            measure(
+                rule.name, rule.scope,
+                rule.color if rule.color is not None else fground,
+                rule.bgcolor if rule.bgcolor is not None else self.bground
+            )
+            for rule in self.colors.values()
+        ]
+        return default, rules
+
+    def get_contrast_report(self, threshold=4.5):
+        """
+        Get the WCAG contrast ratios of the effective foreground and background of every rule.
+
+        Rules with a ratio below `threshold` are listed as failing.  Each unique
+        color pair is only measured once, and the ratios are shared by all
+        matchers of the same scheme content and filter.
+        """
+
+        if self.contrast_ratios is None:
+            key = None
+            if self.filter_signature is not None:
+                key = (self.scheme_hash, self.filter_signature)
+                self.contrast_ratios = contrast_cache.get(key)
+            if self.contrast_ratios is None:
+                self.contrast_ratios = self.measure_contrast()
+                if key is not None:
+                    contrast_cache[key] = self.contrast_ratios
+        default, rules = self.contrast_ratios
+        return ContrastReport(threshold, default, rules, [rule for rule in rules if rule.ratio < threshold])
+
     def get_plist_file(self):
         """Get the plist file used during the process."""
 
+        if self.plist_file is None:
+            # The scheme was loaded from the cache or streamed, so it has not been read yet.
+            self.plist_file = self.read_plist(
+                sublime.load_binary_resource(sublime_format_path(self.color_scheme))
+            )
         return self.plist_file
 
+    def get_cache_stats(self):
+        """Get the hit, miss, and eviction counts of the matched scope cache."""
+
+        return self.matched.stats()
+
     def get_scheme_file(self):
         """Get the scheme file used during the process."""
 
         return self.scheme_file
 
+    def guess_colors(self, view, points, scopes=None):
+        """
+        Guess the colors and style of the text for many Sublime view points.
+
+        Points are grouped by scope, so each unique scope is only resolved once,
+        and the results are returned in the same order as the points.  The
+        points' scope names can be given if they are already known.
+        """
+
+        resolved = {}
+        colors = []
+        if scopes is None:
+            scopes = [view.scope_name(pt) for pt in points]
+        for pt, scope_key in zip(points, scopes):
+            match = resolved.get(scope_key)
+            if match is None:
+                match = self.guess_color(view, pt, scope_key)
+                resolved[scope_key] = match
+            colors.append(match)
+        return colors
+
+    def match_rules(self, scope_key):
+        """
+        Find the rules that win the foreground, background, and font styles of the scope.
+
+        Returns the shared `(fg, bg, bold, italic)` tuple of rule ids.
+        """
+
+        fg = bg = bold = italic = NO_RULE
+        best_match_fg = 0
+        best_match_bg = 0
+        best_match_style = 0
+        for rule_id in self.get_candidates(scope_key):
+            rule = self.rules[rule_id]
+            match = rule.selector.score(scope_key)
+            if rule.color is not None and match > best_match_fg:
+                best_match_fg = match
+                fg = rule_id
+            if match > best_match_style:
+                best_match_style = match
+                if rule.style & STYLE_BOLD:
+                    bold = rule_id
+                if rule.style & STYLE_ITALIC:
+                    italic = rule_id
+            if rule.bgcolor is not None and match > best_match_bg:
+                best_match_bg = match
+                bg = rule_id
+        matched = (fg, bg, bold, italic)
+        return self.match_results.setdefault(matched, matched)
+
     def guess_color(self, view, pt, scope_key):
-        """Guess the colors and style of the text for the given Sublime view pt."""
-
-        color = self.fground
-        color_sim = self.fground_sim
-        bgcolor = self.bground
-        bgcolor_sim = self.bground_sim
-        style = set([])
-        color_selector = SchemeSelectors("foreground", "foreground")
-        bg_selector = SchemeSelectors("background", "background")
-        style_selectors = {"bold": SchemeSelectors("", ""), "italic": SchemeSelectors("", "")}
-        if scope_key in self.matched:
-            color = self.matched[scope_key]["color"]
-            color_sim = self.matched[scope_key]["color_simulated"]
-            style = self.matched[scope_key]["style"]
-            bgcolor = self.matched[scope_key]["bgcolor"]
-            bgcolor_sim = self.matched[scope_key]["bgcolor_simulated"]
-            selectors = self.matched[scope_key]["selectors"]
-            color_selector = selectors["color"]
-            bg_selector = selectors["background"]
-            style_selectors = selectors["style"]
+        """
+        Guess the colors and style of the text for the given Sublime view pt.
+
+        Rules are scored against `scope_key` directly, so `view` and `pt` are
+        only kept for compatibility.
+        """
+
+        matched = self.matched.get(scope_key)
+        if matched is None:
+            matched = self.match_rules(scope_key)
+            self.remember_matched(scope_key, matched)
+            self.matched[scope_key] = matched
+        fg, bg, bold, italic = matched
+
+        if fg == NO_RULE:
+            color, color_sim, color_selector = self.fground, self.fground_sim, FG_SELECTORS
         else:
-            best_match_bg = 0
-            best_match_fg = 0
-            best_match_style = 0
-            for key in self.colors:
-                match = view.score_selector(pt, key)
-                if self.colors[key]["color"] is not None and match > best_match_fg:
-                    best_match_fg = match
-                    color = self.colors[key]["color"]
-                    color_sim = self.colors[key]["color_simulated"]
-                    color_selector = SchemeSelectors(self.colors[key]["name"], self.colors[key]["scope"])
-                if self.colors[key]["style"] is not None and match > best_match_style:
-                    best_match_style = match
-                    for s in self.colors[key]["style"]:
-                        style.add(s)
-                        if s == "bold":
-                            style_selectors["bold"] = SchemeSelectors(
-                                self.colors[key]["name"], self.colors[key]["scope"]
-                            )
-                        elif s == "italic":
-                            style_selectors["italic"] = SchemeSelectors(
-                                self.colors[key]["name"], self.colors[key]["scope"]
-                            )
-                if self.colors[key]["bgcolor"] is not None and match > best_match_bg:
-                    best_match_bg = match
-                    bgcolor = self.colors[key]["bgcolor"]
-                    bgcolor_sim = self.colors[key]["bgcolor_simulated"]
-                    bg_selector = SchemeSelectors(self.colors[key]["name"], self.colors[key]["scope"])
-            self.matched[scope_key] = {
-                "color": color,
-                "bgcolor": bgcolor,
-                "color_simulated": color_sim,
-                "bgcolor_simulated": bgcolor_sim,
-                "style": style,
-                "selectors": {
-                    "color": color_selector,
-                    "background": bg_selector,
-                    "style": style_selectors
-                }
-            }
-        if len(style) == 0:
-            style = "normal"
+            rule = self.rules[fg]
+            if rule.color_sim is None:
+                rule.color_sim = self.simulate_color(rule.color)[0]
+            color, color_sim, color_selector = rule.color, rule.color_sim, rule.names
+
+        if bg == NO_RULE:
+            bgcolor, bgcolor_sim, bg_selector = self.bground, self.bground_sim, BG_SELECTORS
         else:
-            style = ' '.join(style)
+            rule = self.rules[bg]
+            if rule.bgcolor_sim is None:
+                rule.bgcolor_sim = self.simulate_color(rule.bgcolor)[0]
+            bgcolor, bgcolor_sim, bg_selector = rule.bgcolor, rule.bgcolor_sim, rule.names
+
+        style_selectors = {
+            "bold": self.rules[bold].names if bold != NO_RULE else NO_SELECTORS,
+            "italic": self.rules[italic].names if italic != NO_RULE else NO_SELECTORS
+        }
+        style = ' '.join(name for name, rule_id in (("bold", bold), ("italic", italic)) if rule_id != NO_RULE)
+        if not style:
+            style = "normal"
         return SchemeColors(
             color, color_sim, bgcolor, bgcolor_sim, style,
             color_selector, bg_selector, style_selectors
@@ -30,6 +30,21 @@ JSON_PATTERN = re.compile(
     re.DOTALL
 )
 
+SANITIZE_PATTERN = re.compile(
+    r'''(?x)
+        (?P<string>
+            "(?:\\.|[^"\\])*"                # double quoted string
+          | '(?:\\.|[^'\\])*'                # single quoted string
+        )
+      | /\*[^*]*\*+(?:[^/*][^*]*\*+)*/       # multi-line comments
+      | //[^\r\n]*                         # single line comments
+      | ,(?=                                # trailing comma
+            (?:\s|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|//[^\r\n]*)*
+            [\]}]
+        )
+    '''
+)
+
 
 def strip_dangling_commas(text, preserve_lines=False):
     """Strip dangling commas."""
@@ -67,4 +82,7 @@ def strip_comments(text, preserve_lines=False):
 def sanitize_json(text, preserve_lines=False):
     """Sanitize the JSON file by removing comments and dangling commas."""
 
+    if not preserve_lines:
+        # Nothing needs to line up, so do it in one pass.
+        return SANITIZE_PATTERN.sub(lambda m: m.group('string') or '', text)
     return strip_dangling_commas(Comments('json', preserve_lines).strip(text), preserve_lines)
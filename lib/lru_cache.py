@@ -0,0 +1,111 @@
+"""
+LRU cache.
+
+Licensed under MIT
+Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
+"""
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """A thread safe, size bounded mapping that evicts the least recently used entries."""
+
+    def __init__(self, capacity=1000, on_evict=None):
+        """Initialize."""
+
+        self.lock = threading.RLock()
+        # Called with the key and value of each entry evicted to respect the capacity.
+        self.on_evict = on_evict
+        self.cache = OrderedDict()
+        self.capacity = max(1, int(capacity))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        """Get the number of cached entries."""
+
+        with self.lock:
+            return len(self.cache)
+
+    def __contains__(self, key):
+        """Check if the key is cached without affecting usage or statistics."""
+
+        with self.lock:
+            return key in self.cache
+
+    def __iter__(self):
+        """Iterate a snapshot of the keys from least to most recently used."""
+
+        with self.lock:
+            keys = list(self.cache)
+        return iter(keys)
+
+    def get(self, key, default=None):
+        """Get the value and mark it as most recently used."""
+
+        with self.lock:
+            try:
+                value = self.cache[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        """Store the value, evicting the least recently used entries if full."""
+
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        """Evict the least recently used entries until the capacity is respected."""
+
+        with self.lock:
+            while len(self.cache) > self.capacity:
+                key, value = self.cache.popitem(last=False)
+                self.evictions += 1
+                if self.on_evict is not None:
+                    self.on_evict(key, value)
+
+    def pop(self, key, default=None):
+        """Remove the key and return its value."""
+
+        with self.lock:
+            return self.cache.pop(key, default)
+
+    def items(self):
+        """Get the cached items from least to most recently used."""
+
+        with self.lock:
+            return list(self.cache.items())
+
+    def resize(self, capacity):
+        """Change the capacity, evicting entries if needed."""
+
+        with self.lock:
+            self.capacity = max(1, int(capacity))
+            self.evict()
+
+    def clear(self):
+        """Clear the cache, but keep the statistics."""
+
+        with self.lock:
+            self.cache.clear()
+
+    def stats(self):
+        """Get the cache statistics."""
+
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self.cache),
+                "capacity": self.capacity
+            }
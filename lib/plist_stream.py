@@ -0,0 +1,126 @@
+"""
+Plist stream.
+
+Licensed under MIT
+Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
+
+Incrementally parse XML plist files (like `.tmTheme` files) with expat.
+Comments are skipped by the parser, and the entries of the top level
+`settings` array can be handed off as soon as they are parsed instead of
+being collected into the returned tree.
+"""
+import re
+import base64
+import datetime
+from xml.parsers import expat
+
+CHUNK_SIZE = 64 * 1024
+
+# Comments before the XML declaration are not allowed, so skip them.
+RE_LEADING = re.compile(br'(?:\s*<!--[\s\S]*?-->)*\s*')
+
+SCALARS = ('key', 'string', 'integer', 'real', 'date', 'data', 'true', 'false')
+
+# ISO 8601 dates as written by `plistlib`, which may leave off the trailing fields.
+RE_DATE = re.compile(
+    r'(?P<year>\d\d\d\d)(?:-(?P<month>\d\d)(?:-(?P<day>\d\d)'
+    r'(?:T(?P<hour>\d\d)(?::(?P<minute>\d\d)(?::(?P<second>\d\d))?)?)?)?)?Z'
+)
+
+
+def parse_date(text):
+    """Parse a plist date."""
+
+    m = RE_DATE.match(text)
+    fields = [int(value) for value in m.group('year', 'month', 'day', 'hour', 'minute', 'second') if value]
+    # Missing months and days default to the first.
+    fields += [1] * (3 - len(fields))
+    return datetime.datetime(*fields)
+
+
+class PlistStream(object):
+    """Incremental XML plist parser."""
+
+    def __init__(self, on_setting=None):
+        """
+        Initialize.
+
+        If `on_setting` is given, it is called with each entry of the top level
+        `settings` array, and the entries are left out of the parsed tree.
+        """
+
+        self.on_setting = on_setting
+        self.stack = []
+        self.root = None
+        self.text = []
+
+    def parse(self, content):
+        """Parse the plist content and return the top level object."""
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.text.append
+
+        offset = RE_LEADING.match(content).end()
+        size = len(content)
+        while offset < size:
+            parser.Parse(content[offset:offset + CHUNK_SIZE], False)
+            offset += CHUNK_SIZE
+        parser.Parse(b'', True)
+        return self.root
+
+    def start_element(self, name, attrs):
+        """Handle an opening tag."""
+
+        if name == 'dict':
+            self.stack.append([{}, None])
+        elif name == 'array':
+            self.stack.append([[], None])
+        del self.text[:]
+
+    def end_element(self, name):
+        """Handle a closing tag."""
+
+        if name in SCALARS:
+            text = ''.join(self.text)
+            del self.text[:]
+            if name == 'key':
+                self.stack[-1][1] = text
+            elif name == 'integer':
+                self.add_value(int(text))
+            elif name == 'real':
+                self.add_value(float(text))
+            elif name == 'true':
+                self.add_value(True)
+            elif name == 'false':
+                self.add_value(False)
+            elif name == 'data':
+                self.add_value(base64.b64decode(text.encode('ascii')))
+            elif name == 'date':
+                self.add_value(parse_date(text))
+            else:
+                self.add_value(text)
+        elif name in ('dict', 'array'):
+            self.add_value(self.stack.pop()[0])
+
+    def add_value(self, value):
+        """Add a finished value to its parent."""
+
+        if not self.stack:
+            self.root = value
+            return
+
+        parent = self.stack[-1]
+        if isinstance(parent[0], dict):
+            parent[0][parent[1]] = value
+        elif self.on_setting is not None and self.in_settings():
+            self.on_setting(value)
+        else:
+            parent[0].append(value)
+
+    def in_settings(self):
+        """Check if the array being parsed is the top level `settings` array."""
+
+        return len(self.stack) == 2 and self.stack[0][1] == 'settings' and isinstance(self.stack[0][0], dict)
@@ -5,12 +5,40 @@ Licensed under MIT
 Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
 """
 import re
-from colorsys import rgb_to_hls, hls_to_rgb, rgb_to_hsv, hsv_to_rgb
-import decimal
+from colorsys import rgb_to_hls, hls_to_rgb, rgb_to_hsv, hsv_to_rgb, ONE_THIRD, ONE_SIXTH, TWO_THIRD
+from collections import namedtuple, OrderedDict
+from math import floor
+from .lru_cache import LRUCache
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 RGB_CHANNEL_SCALE = 1.0 / 255.0
 HUE_SCALE = 1.0 / 360.0
 
+COLOR_CACHE_SIZE = 2000
+
+# sRGB channels in linear light, for the WCAG relative luminance.
+LINEAR_CHANNELS = tuple(
+    c / 12.92 if c <= 0.03928 else ((c + 0.055) / 1.055) ** 2.4
+    for c in (i * RGB_CHANNEL_SCALE for i in range(256))
+)
+
+# Some `colorsys` versions get the HLS saturation of light colors with `2.0 - (max + min)`
+# instead of `2.0 - max - min`, which can differ in the last bit.  `RGBAArray` must match.
+LEGACY_HLS_SATURATION = rgb_to_hls(134 * RGB_CHANNEL_SCALE, 122 * RGB_CHANNEL_SCALE, 122 * RGB_CHANNEL_SCALE)[2] != (
+    (134 * RGB_CHANNEL_SCALE - 122 * RGB_CHANNEL_SCALE) / (2.0 - 134 * RGB_CHANNEL_SCALE - 122 * RGB_CHANNEL_SCALE)
+)
+
+# Process wide caches shared by every `RGBA` and color scheme matcher.
+channel_cache = LRUCache(COLOR_CACHE_SIZE)
+color_cache = LRUCache(COLOR_CACHE_SIZE)
+
+
+class ColorInfo(namedtuple('ColorInfo', ['rgb', 'simulated', 'luminance'])):
+    """ColorInfo."""
+
 
 def clamp(value, mn, mx):
     """Clamp the value to the the given minimum and maximum."""
@@ -19,40 +47,96 @@ def clamp(value, mn, mx):
 
 
 def round_int(dec):
-    """Round float to nearest int using expected rounding."""
+    """
+    Round float to nearest int using expected rounding.
 
-    return int(decimal.Decimal(dec).quantize(decimal.Decimal('0'), decimal.ROUND_HALF_UP))
+    Halves are rounded away from zero (`ROUND_HALF_UP`).  The fraction
+    `value - floor(value)` is exact for any float, so no decimal math
+    is needed to get the same results.
+    """
 
+    value = abs(dec)
+    whole = int(floor(value))
+    if value - whole >= 0.5:
+        whole += 1
+    return -whole if dec < 0 else whole
 
-class RGBA(object):
-    """RGBA object for converting between color formats or applying filters to the color."""
 
-    r = None
-    g = None
-    b = None
-    a = None
-    color_pattern = re.compile(r"^#(?:([A-Fa-f\d]{6})([A-Fa-f\d]{2})?|([A-Fa-f\d]{3}))")
+def hls_luminance(hls, factor):
+    """Adjust the lightness of an HLS color."""
 
-    def __init__(self, s=None):
-        """Initialize."""
+    h, l, s = hls
+    return h, clamp(l + factor - 1.0, 0.0, 1.0), s
 
-        if s is None:
-            s = "#000000FF"
-        self.r, self.g, self.b, self.a = self._split_channels(s)
 
-    def _split_channels(self, s):
-        """Split the color into color channels: red, green, blue, alpha."""
+def hls_saturation(hls, factor):
+    """Adjust the saturation of an HLS color."""
+
+    h, l, s = hls
+    return h, l, clamp(s + factor - 1.0, 0.0, 1.0)
+
+
+def hls_colorize(hls, deg):
+    """Set the hue of an HLS color."""
+
+    h, l, s = hls
+    return clamp(deg * HUE_SCALE, 0.0, 1.0), l, s
+
+
+def hls_hue(hls, deg):
+    """Shift the hue of an HLS color."""
+
+    h, l, s = hls
+    h = h + deg * HUE_SCALE
+    while h > 1.0:
+        h -= 1.0
+    while h < 0.0:
+        h += 1.0
+    return h, l, s
+
+
+HLS_FILTERS = {
+    "luminance": hls_luminance,
+    "saturation": hls_saturation,
+    "colorize": hls_colorize,
+    "hue": hls_hue
+}
+
+COLOR_FILTERS = frozenset(
+    list(HLS_FILTERS) + ["apply_alpha", "alpha", "red", "green", "blue", "brightness", "invert", "grayscale", "sepia"]
+)
+
+
+class RGBABase(object):
+    """Color conversions and filters shared by the RGBA representations."""
+
+    __slots__ = ()
+    color_pattern = re.compile(r"^#(?:([A-Fa-f\d]{6})([A-Fa-f\d]{2})?|([A-Fa-f\d]{3}))")
+
+    def _pack_channels(self, s):
+        """Get the color channels packed as `0xRRGGBBAA`."""
 
         def alpha_channel(alpha):
             """Get alpha channel."""
             return int(alpha, 16) if alpha else 0xFF
 
-        m = self.color_pattern.match(s)
-        assert(m is not None)
-        if m.group(1):
-            return int(s[1:3], 16), int(s[3:5], 16), int(s[5:7], 16), alpha_channel(m.group(2))
-        else:
-            return int(s[1] * 2, 16), int(s[2] * 2, 16), int(s[3] * 2, 16), 0xFF
+        # The channels are cached packed, which takes far less memory than a tuple.
+        value = channel_cache.get(s)
+        if value is None:
+            m = self.color_pattern.match(s)
+            assert(m is not None)
+            if m.group(1):
+                value = int(s[1:7], 16) << 8 | alpha_channel(m.group(2))
+            else:
+                value = int(s[1] * 2 + s[2] * 2 + s[3] * 2, 16) << 8 | 0xFF
+            channel_cache[s] = value
+        return value
+
+    def _split_channels(self, s):
+        """Split the color into color channels: red, green, blue, alpha."""
+
+        value = self._pack_channels(s)
+        return value >> 24, (value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF
 
     def get_rgba(self):
         """Get the RGB color with the alpha channel."""
@@ -124,9 +208,7 @@ class RGBA(object):
     def luminance(self, factor):
         """True luminance."""
 
-        h, l, s = self.tohls()
-        l = clamp(l + factor - 1.0, 0.0, 1.0)
-        self.fromhls(h, l, s)
+        self.fromhls(*hls_luminance(self.tohls(), factor))
 
     def tohsv(self):
         """Convert to HSV color format."""
@@ -183,21 +265,12 @@ class RGBA(object):
     def colorize(self, deg):
         """Colorize the color with the given hue."""
 
-        h, l, s = self.tohls()
-        h = clamp(deg * HUE_SCALE, 0.0, 1.0)
-        self.fromhls(h, l, s)
+        self.fromhls(*hls_colorize(self.tohls(), deg))
 
     def hue(self, deg):
         """Shift the hue."""
 
-        d = deg * HUE_SCALE
-        h, l, s = self.tohls()
-        h = h + d
-        while h > 1.0:
-            h -= 1.0
-        while h < 0.0:
-            h += 1.0
-        self.fromhls(h, l, s)
+        self.fromhls(*hls_hue(self.tohls(), deg))
 
     def invert(self):
         """Invert the color."""
@@ -209,9 +282,7 @@ class RGBA(object):
     def saturation(self, factor):
         """Saturate or unsaturate the color by the given factor."""
 
-        h, l, s = self.tohls()
-        s = clamp(s + factor - 1.0, 0.0, 1.0)
-        self.fromhls(h, l, s)
+        self.fromhls(*hls_saturation(self.tohls(), factor))
 
     def grayscale(self):
         """Convert the color with a grayscale filter."""
@@ -295,3 +366,512 @@ class RGBA(object):
             self.r = clamp(round_int(components[0]), 0, 255) & 0xFF
             self.g = clamp(round_int(components[1]), 0, 255) & 0xFF
             self.b = clamp(round_int(components[2]), 0, 255) & 0xFF
+
+
+class RGBA(RGBABase):
+    """RGBA object for converting between color formats or applying filters to the color."""
+
+    r = None
+    g = None
+    b = None
+    a = None
+
+    def __init__(self, s=None):
+        """Initialize."""
+
+        if s is None:
+            s = "#000000FF"
+        self.r, self.g, self.b, self.a = self._split_channels(s)
+
+
+class PackedRGBA(RGBABase):
+    """
+    Compact RGBA object.
+
+    The channels are packed into a single 32 bit `0xRRGGBBAA` integer
+    and the object has no `__dict__`.  It behaves exactly like `RGBA`,
+    but reading and writing channels is a little slower, so it is meant
+    for colors that are kept around.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, s=None):
+        """Initialize."""
+
+        if s is None:
+            s = "#000000FF"
+        self.value = self._pack_channels(s)
+
+    @property
+    def r(self):
+        """Red channel."""
+
+        return self.value >> 24
+
+    @r.setter
+    def r(self, value):
+        """Set red channel."""
+
+        self.value = (self.value & 0x00FFFFFF) | ((value & 0xFF) << 24)
+
+    @property
+    def g(self):
+        """Green channel."""
+
+        return (self.value >> 16) & 0xFF
+
+    @g.setter
+    def g(self, value):
+        """Set green channel."""
+
+        self.value = (self.value & 0xFF00FFFF) | ((value & 0xFF) << 16)
+
+    @property
+    def b(self):
+        """Blue channel."""
+
+        return (self.value >> 8) & 0xFF
+
+    @b.setter
+    def b(self, value):
+        """Set blue channel."""
+
+        self.value = (self.value & 0xFFFF00FF) | ((value & 0xFF) << 8)
+
+    @property
+    def a(self):
+        """Alpha channel."""
+
+        return self.value & 0xFF
+
+    @a.setter
+    def a(self, value):
+        """Set alpha channel."""
+
+        self.value = (self.value & 0xFFFFFF00) | (value & 0xFF)
+
+    def get_rgba(self):
+        """Get the RGB color with the alpha channel."""
+
+        return "#%08X" % self.value
+
+    def get_rgb(self):
+        """Get the RGB value."""
+
+        return "#%06X" % (self.value >> 8)
+
+
+def get_color_info(color, background=None):
+    """
+    Get the shared, precomputed info of a color.
+
+    Returns the color without its alpha channel, the color as seen
+    against `background` (or just without alpha if no background is
+    given), and the luminance of the latter.
+    """
+
+    key = (color, background)
+    info = color_cache.get(key)
+    if info is None:
+        rgba = RGBA(color.replace(" ", ""))
+        rgb = rgba.get_rgb()
+        if background is not None:
+            rgba.apply_alpha(background)
+        info = ColorInfo(rgb, rgba.get_rgb(), rgba.get_luminance())
+        color_cache[key] = info
+    return info
+
+
+def get_relative_luminance(color):
+    """Get the WCAG relative luminance of the color, ignoring its alpha channel."""
+
+    rgba = RGBA(color)
+    return 0.2126 * LINEAR_CHANNELS[rgba.r] + 0.7152 * LINEAR_CHANNELS[rgba.g] + 0.0722 * LINEAR_CHANNELS[rgba.b]
+
+
+def get_contrast_ratio(color1, color2):
+    """Get the WCAG contrast ratio of two colors."""
+
+    lum1 = get_relative_luminance(color1)
+    lum2 = get_relative_luminance(color2)
+    if lum1 < lum2:
+        lum1, lum2 = lum2, lum1
+    return (lum1 + 0.05) / (lum2 + 0.05)
+
+
+def get_color_cache_stats():
+    """Get the statistics of the shared color caches."""
+
+    return {"channels": channel_cache.stats(), "colors": color_cache.stats()}
+
+
+class RGBAArray(object):
+    """
+    Apply the `RGBA` filters to many colors at once.
+
+    With NumPy the filters are vectorized over all the colors, mirroring
+    the float operations of `RGBA` and `colorsys` step by step so results
+    are identical.  Without NumPy (or with `vectorize=False`) each color is
+    filtered by its own `RGBA`.
+    """
+
+    def __init__(self, colors, vectorize=True):
+        """Initialize."""
+
+        self.vectorize = vectorize and np is not None
+        if self.vectorize:
+            self.channels = np.array(
+                [(c.r, c.g, c.b, c.a) for c in map(RGBA, colors)], dtype=np.int64
+            ).reshape(-1, 4)
+        else:
+            self.colors = [RGBA(c) for c in colors]
+
+    def __len__(self):
+        """Get the number of colors."""
+
+        return len(self.channels) if self.vectorize else len(self.colors)
+
+    @staticmethod
+    def _round(value):
+        """Vectorized `round_int`."""
+
+        magnitude = np.abs(value)
+        whole = np.floor(magnitude)
+        whole += (magnitude - whole) >= 0.5
+        return np.where(value < 0, -whole, whole).astype(np.int64)
+
+    @staticmethod
+    def _clamp(value, mn, mx):
+        """Vectorized `clamp`."""
+
+        return np.maximum(np.minimum(value, mx), mn)
+
+    def _luminance(self):
+        """Vectorized `get_luminance`."""
+
+        c = self.channels
+        return self._clamp(self._round(0.299 * c[:, 0] + 0.587 * c[:, 1] + 0.114 * c[:, 2]), 0, 255)
+
+    def _tohls(self):
+        """Vectorized `tohls`."""
+
+        r, g, b = (self.channels[:, i] * RGB_CHANNEL_SCALE for i in range(3))
+        maxc = np.maximum(np.maximum(r, g), b)
+        minc = np.minimum(np.minimum(r, g), b)
+        sumc = maxc + minc
+        rangec = maxc - minc
+        lum = sumc / 2.0
+        gray = minc == maxc
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if LEGACY_HLS_SATURATION:
+                light = rangec / (2.0 - sumc)
+            else:
+                light = rangec / (2.0 - maxc - minc)
+            s = np.where(lum <= 0.5, rangec / sumc, light)
+            rc = (maxc - r) / rangec
+            gc = (maxc - g) / rangec
+            bc = (maxc - b) / rangec
+        h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+        h = np.mod(h / 6.0, 1.0)
+        return np.where(gray, 0.0, h), lum, np.where(gray, 0.0, s)
+
+    def _fromhls(self, h, lum, s):
+        """Vectorized `fromhls`."""
+
+        def v(m1, m2, hue):
+            """Vectorized `colorsys._v`."""
+
+            hue = np.mod(hue, 1.0)
+            return np.where(
+                hue < ONE_SIXTH, m1 + (m2 - m1) * hue * 6.0,
+                np.where(hue < 0.5, m2, np.where(hue < TWO_THIRD, m1 + (m2 - m1) * (TWO_THIRD - hue) * 6.0, m1))
+            )
+
+        m2 = np.where(lum <= 0.5, lum * (1.0 + s), lum + s - (lum * s))
+        m1 = 2.0 * lum - m2
+        gray = s == 0.0
+        for i, hue in enumerate((h + ONE_THIRD, h, h - ONE_THIRD)):
+            self.channels[:, i] = self._round(np.where(gray, lum, v(m1, m2, hue)) * 255.0) & 0xFF
+
+    def apply_alpha(self, background="#000000FF"):
+        """Apply the transparency of each color with the given background."""
+
+        if not self.vectorize:
+            for color in self.colors:
+                color.apply_alpha(background)
+            return
+
+        bg = RGBA(background)
+        r, g, b, a = bg.r, bg.g, bg.b, bg.a
+        c = self.channels
+        af = c[:, 3] * RGB_CHANNEL_SCALE
+        mask = c[:, 3] < 0xFF
+        for i, cb in enumerate((r, g, b)):
+            blended = self._round(np.abs(c[:, i] * af + cb * (a * RGB_CHANNEL_SCALE) * (1 - af))) & 0xFF
+            c[:, i] = np.where(mask, blended, c[:, i])
+
+    def brightness(self, factor):
+        """Adjust the brightness by the given factor."""
+
+        if not self.vectorize:
+            for color in self.colors:
+                color.brightness(factor)
+            return
+
+        c = self.channels
+        total_lumes = self._clamp(self._luminance() + (255.0 * factor) - 255.0, 0.0, 255.0)
+        pts = total_lumes - 0.299 * c[:, 0] - 0.587 * c[:, 1] - 0.114 * c[:, 2]
+        components = c[:, :3].astype(np.float64) + pts[:, None]
+        slots = np.ones(components.shape, dtype=bool)
+        for i in range(3):
+            value = components[:, i]
+            overage = np.where(value < 0.0, 0.0 + value, np.where(value > 255.0, value - 255.0, 0.0))
+            components[:, i] = self._clamp(value, 0.0, 255.0)
+            over = overage != 0.0
+            slots[over, i] = False
+            count = slots.sum(axis=1)
+            spread = over & (count > 0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                parts = overage / count
+            add = spread[:, None] & slots
+            components = np.where(add, components + parts[:, None], components)
+
+        result = self._clamp(self._round(components), 0, 255) & 0xFF
+        result = np.where((total_lumes == 255.0)[:, None], 0xFF, result)
+        c[:, :3] = np.where((total_lumes == 0.0)[:, None], 0x00, result)
+
+    def saturation(self, factor):
+        """Saturate or unsaturate the colors by the given factor."""
+
+        if not self.vectorize:
+            for color in self.colors:
+                color.saturation(factor)
+            return
+
+        h, lum, s = self._tohls()
+        self._fromhls(h, lum, self._clamp(s + factor - 1.0, 0.0, 1.0))
+
+    def hue(self, deg):
+        """Shift the hue."""
+
+        if not self.vectorize:
+            for color in self.colors:
+                color.hue(deg)
+            return
+
+        d = deg * HUE_SCALE
+        h, lum, s = self._tohls()
+        h = h + d
+        while True:
+            over = h > 1.0
+            if not over.any():
+                break
+            h = np.where(over, h - 1.0, h)
+        while True:
+            under = h < 0.0
+            if not under.any():
+                break
+            h = np.where(under, h + 1.0, h)
+        self._fromhls(h, lum, s)
+
+    def invert(self):
+        """Invert the colors."""
+
+        if not self.vectorize:
+            for color in self.colors:
+                color.invert()
+            return
+
+        self.channels[:, :3] ^= 0xFF
+
+    def grayscale(self):
+        """Convert the colors with a grayscale filter."""
+
+        if not self.vectorize:
+            for color in self.colors:
+                color.grayscale()
+            return
+
+        self.channels[:, :3] = (self._luminance() & 0xFF)[:, None]
+
+    def sepia(self):
+        """Apply a sepia filter to the colors."""
+
+        if not self.vectorize:
+            for color in self.colors:
+                color.sepia()
+            return
+
+        c = self.channels
+        r, g, b = c[:, 0], c[:, 1], c[:, 2]
+        sepia = [
+            self._clamp(self._round((r * .393) + (g * .769) + (b * .189)), 0, 255) & 0xFF,
+            self._clamp(self._round((r * .349) + (g * .686) + (b * .168)), 0, 255) & 0xFF,
+            self._clamp(self._round((r * .272) + (g * .534) + (b * .131)), 0, 255) & 0xFF
+        ]
+        for i, channel in enumerate(sepia):
+            c[:, i] = channel
+
+    def get_rgba(self):
+        """Get the RGB colors with the alpha channel."""
+
+        if not self.vectorize:
+            return [color.get_rgba() for color in self.colors]
+        return ["#%02X%02X%02X%02X" % tuple(channels) for channels in self.channels.tolist()]
+
+    def get_rgb(self):
+        """Get the RGB colors."""
+
+        if not self.vectorize:
+            return [color.get_rgb() for color in self.colors]
+        return ["#%02X%02X%02X" % tuple(channels[:3]) for channels in self.channels.tolist()]
+
+
+def parse_filters(filters):
+    """
+    Normalize a list of filter steps into `(name, args)` pairs.
+
+    A step is a filter name, or a tuple of the name followed by its
+    arguments: `["invert", ("brightness", 0.9), ("hue", 15)]`.
+    """
+
+    steps = []
+    for step in filters:
+        if isinstance(step, str):
+            step = (step,)
+        name, args = step[0], tuple(step[1:])
+        if name not in COLOR_FILTERS:
+            raise ValueError("Unknown color filter '%s'" % name)
+        steps.append((name, args))
+    return steps
+
+
+def find_scheme_colors(plist):
+    """Map each unique hex color of a scheme to the settings that use it."""
+
+    found = OrderedDict()
+    for item in plist.get("settings", []):
+        settings = item.get("settings", {})
+        for key, value in settings.items():
+            if isinstance(value, str):
+                color = value.replace(" ", "")
+                if RGBA.color_pattern.match(color):
+                    found.setdefault(color, []).append((settings, key))
+    return found
+
+
+def format_filtered(original, rgba):
+    """Format the filtered color, only keeping an alpha channel if the original had one or it changed."""
+
+    return rgba[:-2] if rgba.endswith("FF") and len(original) != 9 else rgba
+
+
+def array_color_filter(filters, vectorize=True):
+    """
+    Create a `ColorSchemeMatcher` `color_filter` from a list of filter steps.
+
+    All the hex colors in the scheme are collected, filtered together
+    in one `RGBAArray`, and written back.
+    """
+
+    steps = parse_filters(filters)
+    for name, args in steps:
+        if not hasattr(RGBAArray, name):
+            raise ValueError("Color filter '%s' can't be applied to arrays" % name)
+
+    def color_filter(plist):
+        """Filter the scheme colors."""
+
+        found = find_scheme_colors(plist)
+        colors = RGBAArray(found.keys(), vectorize)
+        for name, args in steps:
+            getattr(colors, name)(*args)
+
+        for (color, targets), rgba in zip(found.items(), colors.get_rgba()):
+            value = format_filtered(color, rgba)
+            for settings, key in targets:
+                settings[key] = value
+        return plist
+
+    return color_filter
+
+
+class FilterChain(object):
+    """
+    A compiled chain of color filters usable as a `ColorSchemeMatcher` `color_filter`.
+
+    Consecutive HLS filters (`saturation`, `luminance`, `hue`, `colorize`)
+    are fused so the color is converted to HLS and back only once per run
+    of them.  As the intermediate colors are no longer rounded to 8 bit
+    channels, fused results can differ from applying the filters one by
+    one by a channel step.  Each unique color is only filtered once.
+    """
+
+    def __init__(self, filters):
+        """Initialize."""
+
+        self.steps = parse_filters(filters)
+        self.signature = repr(self.steps)
+        self.stages = self.compile(self.steps)
+        self.cache = {}
+
+    @staticmethod
+    def compile(steps):
+        """Compile the steps into stages that each take an `RGBA`."""
+
+        def hls_stage(ops):
+            """Apply a run of HLS filters with one HLS round trip."""
+
+            def stage(rgba):
+                """Stage."""
+
+                hls = rgba.tohls()
+                for op, args in ops:
+                    hls = op(hls, *args)
+                rgba.fromhls(*hls)
+            return stage
+
+        def rgb_stage(name, args):
+            """Apply a filter directly."""
+
+            def stage(rgba):
+                """Stage."""
+
+                getattr(rgba, name)(*args)
+            return stage
+
+        stages = []
+        ops = []
+        for name, args in steps:
+            if name in HLS_FILTERS:
+                ops.append((HLS_FILTERS[name], args))
+                continue
+            if ops:
+                stages.append(hls_stage(ops))
+                ops = []
+            stages.append(rgb_stage(name, args))
+        if ops:
+            stages.append(hls_stage(ops))
+        return stages
+
+    def apply(self, color):
+        """Filter a single hex color."""
+
+        value = self.cache.get(color)
+        if value is None:
+            rgba = RGBA(color)
+            for stage in self.stages:
+                stage(rgba)
+            value = format_filtered(color, rgba.get_rgba())
+            self.cache[color] = value
+        return value
+
+    def __call__(self, plist):
+        """Filter the scheme colors."""
+
+        for color, targets in find_scheme_colors(plist).items():
+            value = self.apply(color)
+            for settings, key in targets:
+                settings[key] = value
+        return plist
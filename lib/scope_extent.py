@@ -0,0 +1,37 @@
+"""
+Scope extent.
+
+Licensed under MIT
+Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
+
+Find the extent of a scope around a point by expanding out from it,
+instead of scanning every region of the buffer that matches the scope.
+"""
+import sublime
+
+
+def get_scope_extent(view, pt, scope_name):
+    """
+    Get the extent of the scope by expanding out from the point.
+
+    Only the scope's neighbors are visited, jumping a whole token at a
+    time, so the cost does not depend on the size of the file.
+    """
+
+    file_end = view.size()
+    if pt == file_end:
+        # The end of the file has no character, so it belongs to an extent ending there.
+        if pt == 0 or not view.match_selector(pt - 1, scope_name):
+            return sublime.Region(pt)
+        pt -= 1
+
+    extent = view.extract_scope(pt)
+    if not extent.contains(pt) or extent.end() == pt:
+        extent = sublime.Region(pt, pt + 1)
+    begin, end = extent.begin(), extent.end()
+
+    while begin > 0 and view.match_selector(begin - 1, scope_name):
+        begin = min(view.extract_scope(begin - 1).begin(), begin - 1)
+    while end < file_end and view.match_selector(end, scope_name):
+        end = max(view.extract_scope(end).end(), end + 1)
+    return sublime.Region(begin, min(end, file_end))
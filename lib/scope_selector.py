@@ -0,0 +1,290 @@
+"""
+Scope selector.
+
+Licensed under MIT
+Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
+
+Compile scope selectors into matcher objects that score scope strings
+without a Sublime view.  Scores mimic `view.score_selector`: every matched
+selector name contributes its number of dot separated atoms, shifted three
+bits for each level the matched scope is nested.
+"""
+import re
+from .lru_cache import LRUCache
+
+RE_SELECTOR_TOKEN = re.compile(r'\s*(?:([,|&()])|(-)|([^\s,|&()\-][^\s,|&()]*))')
+
+COMPILE_CACHE_SIZE = 2000
+
+# Selector string -> compiled selector, shared by the schemes that use the same selectors.
+_compiled = LRUCache(COMPILE_CACHE_SIZE)
+
+
+class ScopePath(object):
+    """A descendant chain of scope names: `source.python string.quoted`."""
+
+    def __init__(self, names):
+        """Initialize."""
+
+        self.names = tuple(
+            (name, name + '.', name.count('.') + 1) for name in reversed(names)
+        )
+
+    def score(self, atoms):
+        """Score the scope atoms matching the chain from the innermost scope outward."""
+
+        depth = len(atoms)
+        total = 0
+        for name, prefix, weight in self.names:
+            depth -= 1
+            while depth >= 0:
+                atom = atoms[depth]
+                if atom == name or atom.startswith(prefix):
+                    break
+                depth -= 1
+            else:
+                return 0
+            total += weight << (3 * depth)
+        return total
+
+    def required(self):
+        """Get the scope names required to match."""
+
+        return set([self.names[0][0]])
+
+
+class Negation(object):
+    """A leading negation: `- comment`."""
+
+    def __init__(self, item):
+        """Initialize."""
+
+        self.item = item
+
+    def score(self, atoms):
+        """Match with the lowest score if the negated selector does not match."""
+
+        return 0 if self.item.score(atoms) else 1
+
+    def required(self):
+        """Negations match nearly everything, so nothing can be required."""
+
+        return None
+
+
+class Union(object):
+    """Alternatives: `a, b` or `a | b`."""
+
+    def __init__(self, left, right):
+        """Initialize."""
+
+        self.left = left
+        self.right = right
+
+    def score(self, atoms):
+        """Get the best score of either side."""
+
+        return max(self.left.score(atoms), self.right.score(atoms))
+
+    def required(self):
+        """Either side's requirements can satisfy the selector."""
+
+        left = self.left.required()
+        right = self.right.required()
+        if left is None or right is None:
+            return None
+        return left | right
+
+
+class Intersection(object):
+    """Both sides must match: `a & b`."""
+
+    def __init__(self, left, right):
+        """Initialize."""
+
+        self.left = left
+        self.right = right
+
+    def score(self, atoms):
+        """Get the best score if both sides match."""
+
+        left = self.left.score(atoms)
+        right = self.right.score(atoms) if left else 0
+        return max(left, right) if right else 0
+
+    def required(self):
+        """Use the requirements of either side to narrow the selector."""
+
+        left = self.left.required()
+        return left if left is not None else self.right.required()
+
+
+class Difference(object):
+    """The left side must match and the right side must not: `a - b`."""
+
+    def __init__(self, left, right):
+        """Initialize."""
+
+        self.left = left
+        self.right = right
+
+    def score(self, atoms):
+        """Get the left side score unless the right side matches."""
+
+        score = self.left.score(atoms)
+        if score and self.right.score(atoms):
+            score = 0
+        return score
+
+    def required(self):
+        """Only the left side is required."""
+
+        return self.left.required()
+
+
+class Nothing(object):
+    """An empty selector which never matches."""
+
+    def score(self, atoms):
+        """Never match."""
+
+        return 0
+
+    def required(self):
+        """Nothing can be required."""
+
+        return None
+
+
+class SelectorParser(object):
+    """
+    Parse a scope selector.
+
+    Like TextMate, `,` has the lowest precedence and `|`, `&`, `-` are
+    evaluated left to right.  Unbalanced parentheses are tolerated.
+    """
+
+    def __init__(self, selector):
+        """Initialize."""
+
+        self.tokens = []
+        for m in RE_SELECTOR_TOKEN.finditer(selector):
+            operator, minus, name = m.groups()
+            if operator or minus:
+                self.tokens.append(operator or minus)
+            elif name:
+                self.tokens.append((name,))
+        self.index = 0
+
+    def peek(self):
+        """Get the next token without consuming it."""
+
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def parse(self):
+        """Parse the selector."""
+
+        item = self.parse_selector()
+        while self.index < len(self.tokens):
+            # Stray closing parenthesis: skip and keep going.
+            self.index += 1
+            item = self.join(Union, item, self.parse_selector())
+        return item
+
+    def join(self, kind, left, right):
+        """Join two items, dropping empty ones."""
+
+        if isinstance(left, Nothing):
+            return right if kind is Union else left
+        if isinstance(right, Nothing):
+            return left
+        return kind(left, right)
+
+    def parse_selector(self):
+        """Parse comma separated composites."""
+
+        item = self.parse_composite()
+        while self.peek() == ',':
+            self.index += 1
+            item = self.join(Union, item, self.parse_composite())
+        return item
+
+    def parse_composite(self):
+        """Parse expressions joined by `|`, `&`, `-`, or juxtaposition."""
+
+        item = self.parse_expression()
+        while True:
+            token = self.peek()
+            if token in ('|', '&', '-'):
+                self.index += 1
+                kind = Union if token == '|' else (Intersection if token == '&' else Difference)
+                item = self.join(kind, item, self.parse_expression())
+            elif token == '(' or isinstance(token, tuple):
+                # A group next to more scopes: `(a, b) c`.  Require both.
+                item = self.join(Intersection, item, self.parse_expression())
+            else:
+                break
+        return item
+
+    def parse_expression(self):
+        """Parse an optionally negated group or path."""
+
+        token = self.peek()
+        if token == '-':
+            self.index += 1
+            item = self.parse_expression()
+            return Nothing() if isinstance(item, Nothing) else Negation(item)
+        if token == '(':
+            self.index += 1
+            item = self.parse_selector()
+            if self.peek() == ')':
+                self.index += 1
+            return item
+
+        names = []
+        while isinstance(self.peek(), tuple):
+            names.append(self.tokens[self.index][0])
+            self.index += 1
+        return ScopePath(names) if names else Nothing()
+
+
+class ScopeSelector(object):
+    """A compiled scope selector."""
+
+    def __init__(self, selector):
+        """Initialize."""
+
+        self.selector = selector
+        self.matcher = SelectorParser(selector).parse()
+
+    def score(self, scope):
+        """Score the given scope string."""
+
+        # Scores are not memoized, the matched scope cache already remembers the results.
+        return self.matcher.score(tuple(scope.split()))
+
+    def match(self, scope):
+        """Check if the selector matches the given scope string."""
+
+        return self.score(scope) > 0
+
+    def required(self):
+        """
+        Get the scope names the selector requires in order to match anything.
+
+        A scope can only match if one of its atoms is one of the returned names
+        or starts with one of them followed by a `.`.  `None` is returned if the
+        selector cannot be narrowed down.
+        """
+
+        return self.matcher.required()
+
+
+def compile_selector(selector):
+    """Compile the selector, or get it from the cache if it has already been compiled."""
+
+    compiled = _compiled.get(selector)
+    if compiled is None:
+        compiled = ScopeSelector(selector)
+        _compiled[selector] = compiled
+    return compiled
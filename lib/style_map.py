@@ -0,0 +1,214 @@
+"""
+Style map.
+
+Licensed under MIT
+Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
+
+Map the effective colors and style of every character in a view as
+run-length encoded `(start, end, scope id)` runs.  Scopes are kept rather
+than just their styles, as an edit that changes scopes that share a style
+still changes how later edits and scheme changes affect the text.
+"""
+import sublime
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+
+class TextStyle(namedtuple('TextStyle', ['fg', 'fg_simulated', 'bg', 'bg_simulated', 'style'])):
+    """TextStyle."""
+
+
+class StyleMap(object):
+    """Run-length map of the effective colors and style of a view's text."""
+
+    def __init__(self, matcher):
+        """Initialize."""
+
+        self.matcher = matcher
+        self.styles = []
+        self.style_ids = {}
+        self.scopes = []
+        self.scope_ids = {}
+        self.scope_styles = array('l')
+        self.starts = array('l')
+        self.ends = array('l')
+        self.ids = array('l')
+        self.size = 0
+
+    def get_scope_id(self, view, pt, scope):
+        """Get the id of the scope, resolving its style the first time it is seen."""
+
+        scope_id = self.scope_ids.get(scope)
+        if scope_id is None:
+            match = self.matcher.guess_color(view, pt, scope)
+            style = TextStyle(match.fg, match.fg_simulated, match.bg, match.bg_simulated, match.style)
+            style_id = self.style_ids.get(style)
+            if style_id is None:
+                style_id = len(self.styles)
+                self.styles.append(style)
+                self.style_ids[style] = style_id
+            scope_id = len(self.scopes)
+            self.scopes.append(scope)
+            self.scope_ids[scope] = scope_id
+            self.scope_styles.append(style_id)
+        return scope_id
+
+    def scan(self, view, begin, end):
+        """Get the scope runs between the two points, merging neighbors with the same scope."""
+
+        runs = []
+        if hasattr(view, 'extract_tokens_with_scopes'):
+            tokens = [
+                (max(r.begin(), begin), min(r.end(), end), scope)
+                for r, scope in view.extract_tokens_with_scopes(sublime.Region(begin, end))
+            ]
+        else:
+            tokens = []
+            pt = begin
+            scope = view.scope_name(pt) if pt < end else None
+            while pt < end:
+                run_end = pt + 1
+                next_scope = None
+                while run_end < end:
+                    next_scope = view.scope_name(run_end)
+                    if next_scope != scope:
+                        break
+                    run_end += 1
+                tokens.append((pt, run_end, scope))
+                pt, scope = run_end, next_scope
+
+        for start, stop, scope in tokens:
+            if start >= stop:
+                continue
+            scope_id = self.get_scope_id(view, start, scope)
+            if runs and runs[-1][2] == scope_id and runs[-1][1] == start:
+                runs[-1][1] = stop
+            else:
+                runs.append([start, stop, scope_id])
+        return runs
+
+    def build(self, view):
+        """Map the whole view."""
+
+        self.size = view.size()
+        self.store(self.scan(view, 0, self.size))
+
+    def store(self, runs):
+        """Store the runs in the compact arrays."""
+
+        self.starts = array('l', [r[0] for r in runs])
+        self.ends = array('l', [r[1] for r in runs])
+        self.ids = array('l', [r[2] for r in runs])
+
+    def get_runs(self, begin, end, delta=0):
+        """Get the stored runs clipped to the region and shifted by delta."""
+
+        runs = []
+        index = max(bisect_right(self.starts, begin) - 1, 0)
+        count = len(self.starts)
+        while index < count and self.starts[index] < end:
+            start = max(self.starts[index], begin)
+            stop = min(self.ends[index], end)
+            if start < stop:
+                runs.append([start + delta, stop + delta, self.ids[index]])
+            index += 1
+        return runs
+
+    def update(self, view, begin, end, delta):
+        """
+        Update the map after an edit.
+
+        `begin` and `end` bound the modified text in the current buffer and
+        `delta` is the change in buffer size.  Only the modified lines are
+        scanned, plus any following lines whose scopes were changed by the
+        edit (an unclosed string for instance).
+        """
+
+        old_size = self.size
+        self.size = view.size()
+        start = view.line(begin).begin()
+        stop = min(view.full_line(end).end(), self.size)
+
+        head = self.get_runs(0, start)
+        tail = self.get_runs(stop - delta, old_size, delta)
+        new = self.scan(view, start, stop)
+
+        # Keep scanning until the scopes agree with the old ones again.
+        tail_starts = [r[0] for r in tail]
+        pt = stop
+        while pt < self.size:
+            line_end = min(view.full_line(pt).end(), self.size)
+            fresh = self.scan(view, pt, line_end)
+            index = max(bisect_right(tail_starts, pt) - 1, 0)
+            expected = []
+            for s, e, scope_id in tail[index:]:
+                if s >= line_end:
+                    break
+                s, e = max(s, pt), min(e, line_end)
+                if s < e:
+                    if expected and expected[-1][2] == scope_id and expected[-1][1] == s:
+                        expected[-1][1] = e
+                    else:
+                        expected.append([s, e, scope_id])
+            new.extend(fresh)
+            pt = line_end
+            if fresh == expected:
+                break
+
+        rest = [[max(s, pt), e, scope_id] for s, e, scope_id in tail if e > pt]
+        runs = []
+        for run in head + new + rest:
+            if runs and runs[-1][2] == run[2] and runs[-1][1] == run[0]:
+                runs[-1][1] = run[1]
+            else:
+                runs.append(run)
+        self.store(runs)
+
+    def style_at(self, pt):
+        """Get the style at the given point."""
+
+        index = bisect_right(self.starts, pt) - 1
+        if index < 0 or pt >= self.ends[index]:
+            return None
+        return self.styles[self.scope_styles[self.ids[index]]]
+
+    def scope_runs(self):
+        """Iterate the runs as `(start, end, scope)`."""
+
+        for start, end, scope_id in zip(self.starts, self.ends, self.ids):
+            yield start, end, self.scopes[scope_id]
+
+    def style_runs(self, begin, end):
+        """Iterate the runs in the region as `(start, end, style)`, merging neighbors with the same style."""
+
+        return self.merge_styles(self.get_runs(begin, end))
+
+    def scan_style_runs(self, view, begin, end):
+        """
+        Scan the region and iterate its runs as `(start, end, style)` without storing them.
+
+        This is for looking at a few lines without mapping the whole view.
+        """
+
+        return self.merge_styles(self.scan(view, begin, end))
+
+    def merge_styles(self, runs):
+        """Iterate scope runs as `(start, end, style)`, merging neighbors with the same style."""
+
+        run = None
+        for start, end, scope_id in runs:
+            style_id = self.scope_styles[scope_id]
+            if run is not None and run[2] == style_id and run[1] == start:
+                run[1] = end
+                continue
+            if run is not None:
+                yield run[0], run[1], self.styles[run[2]]
+            run = [start, end, style_id]
+        if run is not None:
+            yield run[0], run[1], self.styles[run[2]]
+
+    def __iter__(self):
+        """Iterate all the runs as `(start, end, style)`."""
+
+        return self.style_runs(0, self.size)
@@ -6,9 +6,15 @@ Copyright (c) 2012 - 2015 Isaac Muse <isaacmuse@gmail.com>
 """
 import sublime
 import sublime_plugin
-from time import time, sleep
+from time import time
 import threading
+from functools import partial
+from os import path
 from ScopeHunter.lib.color_scheme_matcher import ColorSchemeMatcher
+from ScopeHunter.lib.lru_cache import LRUCache
+from ScopeHunter.lib.rgba import get_color_cache_stats
+from ScopeHunter.lib.scope_extent import get_scope_extent
+from ScopeHunter.lib.style_map import StyleMap
 from ScopeHunter.scope_hunter_notify import notify, error
 import traceback
 
@@ -19,9 +25,23 @@ if TOOLTIP_SUPPORT:
 if 'sh_thread' not in globals():
     sh_thread = None
 
-scheme_matcher = None
+scheme_pool = LRUCache(4)
+scheme_loading = set()
+# Scheme key -> generation of its latest load, so older loads that finish late are discarded
+scheme_generations = {}
+scheme_lock = threading.Lock()
 sh_settings = {}
 
+# Scopes and extents of recently scoped points, per view
+scope_caches = {}
+# View id -> style map of the view's scope styles
+style_maps = {}
+SCOPE_CACHE_POINTS = 256
+SCOPE_CACHE_EXTENTS = 32
+
+# Time to spend on multi-selection scoping before letting the editor catch up
+MULTISELECT_CHUNK_TIME = 0.02
+
 ADD_CSS = '''
 .scope-hunter.content { margin: 0; padding: 0.5em; }
 .scope-hunter.small { font-size: 0.8em; }
@@ -97,6 +117,10 @@ SYNTAX_FILE = '''
 [(copy)](copy-syntax:%d){: .scope-hunter .small}
 '''
 
+SCHEME_LOADING = '''
+*scheme loading...*{: .scope-hunter .small}
+'''
+
 COPY_ALL = '''
 ---
 
@@ -180,6 +204,64 @@ def get_color_box(color, caption, link, index):
     )
 
 
+class ScopeCache(object):
+    """Scope names and extents of a view's points, valid until its text or syntax changes."""
+
+    def __init__(self, state):
+        """Initialize."""
+
+        self.state = state
+        # Point -> `[scope, extent]`
+        self.points = LRUCache(SCOPE_CACHE_POINTS)
+        # Recent `(extent, scope)`, newest last
+        self.extents = []
+
+    def scope_name(self, view, pt):
+        """Get the scope name of the point."""
+
+        entry = self.points.get(pt)
+        if entry is None:
+            entry = [view.scope_name(pt), None]
+            self.points[pt] = entry
+        return entry[0]
+
+    def extent(self, pt, scope, get_extent):
+        """
+        Get the scope extent of the point.
+
+        Points sharing the scope name of a known extent that contains them
+        share the extent.  The scope name must still be known, as tokens
+        nested in an extent have scopes of their own.
+        """
+
+        entry = self.points.get(pt)
+        if entry is None:
+            entry = [scope, None]
+            self.points[pt] = entry
+        if entry[1] is None:
+            for extent, extent_scope in reversed(self.extents):
+                if extent_scope == scope and extent.contains(pt):
+                    entry[1] = extent
+                    break
+            else:
+                entry[1] = get_extent(pt, scope)
+                self.extents.append((entry[1], scope))
+                if len(self.extents) > SCOPE_CACHE_EXTENTS:
+                    del self.extents[0]
+        return entry[1]
+
+
+def get_scope_cache(view):
+    """Get the view's scope cache, starting over when the view has changed."""
+
+    state = (view.change_count(), view.settings().get('syntax'))
+    cache = scope_caches.get(view.id())
+    if cache is None or cache.state != state:
+        cache = ScopeCache(state)
+        scope_caches[view.id()] = cache
+    return cache
+
+
 class ScopeHunterEditCommand(sublime_plugin.TextCommand):
     """Edit a view."""
 
@@ -203,28 +285,24 @@ class ScopeHunterEditCommand(sublime_plugin.TextCommand):
 class GetSelectionScope(object):
     """Get the scope and the selection(s)."""
 
+    view = None
+    job = 0
+
     def next_index(self):
         """Get next index into scope buffer."""
 
         self.index += 1
         return self.index
 
-    def get_extents(self, pt):
-        """Get the scope extent via the sublime API."""
+    def get_extent(self, pt, scope_name):
+        """Get the extent of the scope by expanding out from the point."""
 
-        pts = None
-        file_end = self.view.size()
-        scope_name = self.view.scope_name(pt)
-        for r in self.view.find_by_selector(scope_name):
-            if r.contains(pt):
-                pts = r
-                break
-            elif pt == file_end and r.end() == pt:
-                pts = r
-                break
+        return get_scope_extent(self.view, pt, scope_name)
 
-        if pts is None:
-            pts = sublime.Region(pt)
+    def get_extents(self, pt, scope):
+        """Get the scope extent via the sublime API."""
+
+        pts = self.scope_cache.extent(pt, scope, self.get_extent)
 
         row1, col1 = self.view.rowcol(pts.begin())
         row2, col2 = self.view.rowcol(pts.end())
@@ -235,9 +313,13 @@ class GetSelectionScope(object):
 
         if self.points_info or self.rowcol_info:
             if self.points_info:
-                self.scope_bfr.append('Scope Extents (Pts): (' + pts.begin() + ', ' + pts.end() + ')')
+                self.scope_bfr.append('Scope Extents (Pts): (%d, %d)' % (pts.begin(), pts.end()))
             if self.rowcol_info:
-                self.scope_bfr.append('Scope Extents (Line/Char) : (line:' + row1+1 + ' char:' + col1+1 + ', line:' + row2+1 + ' char:' + col2+1)
+                self.scope_bfr.append(
+                    'Scope Extents (Line/Char): (line:%d char:%d, line:%d char:%d)' % (
+                        row1 + 1, col1 + 1, row2 + 1, col2 + 1
+                    )
+                )
 
             if self.show_popup:
                 self.scope_bfr_tool.append(SCOPE_EXTENT_HEADER)
@@ -249,8 +331,7 @@ class GetSelectionScope(object):
     def get_scope(self, pt):
         """Get the scope at the cursor."""
 
-        scope = self.view.scope_name(pt)
-        spacing = "\n" + (" " * 31)
+        scope = self.scope_cache.scope_name(self.view, pt)
 
         if self.clipboard:
             self.clips.append(scope)
@@ -259,11 +340,11 @@ class GetSelectionScope(object):
             self.status = scope
             self.first = False
 
-        self.scope_bfr.append(self.view.scope_name(pt))
+        self.scope_bfr.append(scope)
 
         if self.show_popup:
             self.scope_bfr_tool.append('## Scope\n')
-            self.scope_bfr_tool.append(SCOPES % (self.view.scope_name(pt).strip(), self.next_index()))
+            self.scope_bfr_tool.append(SCOPES % (scope.strip(), self.next_index()))
 
         return scope
 
@@ -306,7 +387,7 @@ class GetSelectionScope(object):
     def get_scheme_syntax(self):
         """Get color scheme and syntax file path."""
 
-        self.scheme_file = scheme_matcher.color_scheme.replace('\\', '/')
+        self.scheme_file = self.scheme_matcher.color_scheme.replace('\\', '/')
         self.syntax_file = self.view.settings().get('syntax')
         self.scope_bfr.append('Scheme File: ' + self.scheme_file)
         self.scope_bfr.append('Syntax File: ' + self.syntax_file)
@@ -345,17 +426,40 @@ class GetSelectionScope(object):
                 self.scope_bfr_tool.append(ITALIC_SCOPE % (style_selectors["italic"].scope, self.next_index()))
             self.scope_bfr_tool.append('\n')
 
-    def get_info(self, pt):
+    def get_scheme_loading(self):
+        """Note that the color scheme is still loading."""
+
+        self.scope_bfr.append('Scheme: loading...')
+        if self.show_popup:
+            self.scope_bfr_tool.append(SCHEME_LOADING)
+            self.next_index()
+
+    def guess_colors(self, pts):
+        """Resolve the colors of all the points at once, only evaluating each unique scope once."""
+
+        if self.scheme_info and not self.scheme_loading and self.scheme_matcher is not None:
+            try:
+                scopes = [self.scope_cache.scope_name(self.view, pt) for pt in pts]
+                return self.scheme_matcher.guess_colors(self.view, pts, scopes)
+            except Exception:
+                # Let each point evaluate and report the failure.
+                pass
+        return [None] * len(pts)
+
+    def get_info(self, pt, match=None):
         """Get scope related info."""
 
         scope = self.get_scope(pt)
 
-        if self.rowcol_info or self.points_info or self.highlight_extent:
-            self.get_extents(pt)
+        if self.extent_info:
+            self.get_extents(pt, scope)
 
-        if (self.appearance_info or self.selector_info) and scheme_matcher is not None:
+        if (self.appearance_info or self.selector_info) and self.scheme_loading:
+            self.get_scheme_loading()
+        elif (self.appearance_info or self.selector_info) and self.scheme_matcher is not None:
             try:
-                match = scheme_matcher.guess_color(self.view, pt, scope)
+                if match is None:
+                    match = self.scheme_matcher.guess_color(self.view, pt, scope)
                 color = match.fg
                 bgcolor = match.bg
                 color_sim = match.fg_simulated
@@ -376,7 +480,7 @@ class GetSelectionScope(object):
                 error("Evaluating theme failed!")
                 self.scheme_info = False
 
-        if self.file_path_info and scheme_matcher:
+        if self.file_path_info and self.scheme_matcher:
             self.get_scheme_syntax()
 
         self.next_index()
@@ -457,7 +561,6 @@ class GetSelectionScope(object):
 
         self.view = v
         self.window = self.view.window()
-        view = self.window.get_output_panel('scope_viewer')
         self.scope_bfr = []
         self.scope_bfr_tool = []
         self.clips = []
@@ -483,22 +586,79 @@ class GetSelectionScope(object):
         self.show_simulated = bool(sh_settings.get("show_simulated_alpha_colors", False))
         self.file_path_info = bool(sh_settings.get("file_paths", False))
         self.selector_info = bool(sh_settings.get("selectors", False))
+        self.extent_info = self.rowcol_info or self.points_info or self.highlight_extent
         self.scheme_info = self.appearance_info or self.selector_info
         self.first = True
         self.extents = []
+        self.scheme_matcher, self.scheme_loading = get_scheme_matcher(self.view)
+        self.scope_cache = get_scope_cache(self.view)
+        self.job += 1
 
         # Get scope info for each selection wanted
         self.index = -1
         if len(self.view.sel()):
             if self.multiselect:
-                count = 0
-                for sel in self.view.sel():
-                    if count > 0 and self.show_popup:
-                        self.scope_bfr_tool.append('\n---\n')
-                    self.get_info(sel.b)
-                    count += 1
-            else:
-                self.get_info(self.view.sel()[0].b)
+                self.multiselect_max = int(sh_settings.get("multiselect_max", 100))
+                self.shown = set()
+                self.scope_selections(self.job, [sel.b for sel in self.view.sel()], 0)
+                return
+            self.get_info(self.view.sel()[0].b)
+        self.display()
+
+    def scope_selections(self, job, pts, start):
+        """
+        Scope the selections a chunk at a time, then display them.
+
+        Selections with a scope and extent that are already shown are
+        skipped.  When the chunk's time is up, the rest are scoped later so
+        the editor can handle input in between; a newer job cancels them.
+        """
+
+        if job != self.job:
+            return
+        deadline = time() + MULTISELECT_CHUNK_TIME
+        end = len(pts)
+        chunk = []
+        while start < end and len(self.shown) < self.multiselect_max and time() < deadline:
+            pt = pts[start]
+            start += 1
+            scope = self.scope_cache.scope_name(self.view, pt)
+            key = (scope, self.scope_cache.extent(pt, scope, self.get_extent) if self.extent_info else None)
+            if key not in self.shown:
+                self.shown.add(key)
+                chunk.append(pt)
+
+        for pt, match in zip(chunk, self.guess_colors(chunk)):
+            if self.index >= 0 and self.show_popup:
+                self.scope_bfr_tool.append('\n---\n')
+            self.get_info(pt, match)
+
+        if start < end and len(self.shown) < self.multiselect_max:
+            sublime.set_timeout(partial(sh_thread.run_ignoring, self.scope_selections, job, pts, start), 0)
+            return
+
+        if len(self.shown) < end:
+            self.get_multiselect_summary(end, start < end)
+        self.display()
+
+    def get_multiselect_summary(self, total, limited):
+        """Note how many of the selections are shown."""
+
+        summary = 'Showing %d unique scopes of %d selections' % (len(self.shown), total)
+        if limited:
+            summary += ' (multiselect_max reached)'
+        self.scope_bfr.append(summary)
+        if self.show_popup:
+            self.scope_bfr_tool.append('\n---\n%s\n' % summary)
+
+    def cancel(self, view):
+        """Cancel the pending scoping of the view."""
+
+        if self.view is not None and self.view.id() == view.id():
+            self.job += 1
+
+    def display(self):
+        """Display the gathered info."""
 
         # Copy scopes to clipboard
         if self.clipboard:
@@ -512,7 +672,7 @@ class GetSelectionScope(object):
         if self.show_panel:
             ScopeHunterEditCommand.bfr = '\n'.join(self.scope_bfr)
             ScopeHunterEditCommand.pt = 0
-            view.run_command('scope_hunter_edit')
+            self.window.get_output_panel('scope_viewer').run_command('scope_hunter_edit')
             ScopeHunterEditCommand.clear()
             self.window.run_command("show_panel", {"panel": "output.scope_viewer"})
 
@@ -553,7 +713,95 @@ class GetSelectionScopeCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         """On demand scope request."""
 
-        sh_thread.modified = True
+        sh_thread.modify(self.view, debounce=False)
+
+    def is_enabled(self):
+        """Check if we should scope this view."""
+
+        return sh_thread.is_enabled(self.view)
+
+
+class GetColorRulesCommand(sublime_plugin.TextCommand):
+    """Command to show the rules that use a color and the scopes they were matched to."""
+
+    def run(self, edit, color=None):
+        """Show the rules of the given color, or the foreground color under the cursor."""
+
+        matcher, loading = get_scheme_matcher(self.view)
+        if matcher is None:
+            notify("Color scheme is still loading" if loading else "Color scheme could not be loaded")
+            return
+        if color is None:
+            if not len(self.view.sel()):
+                return
+            pt = self.view.sel()[0].b
+            color = matcher.guess_color(self.view, pt, self.view.scope_name(pt)).fg
+
+        bfr = ['Color: %s' % color]
+        rules = matcher.get_color_rules(color)
+        if not rules:
+            bfr.append('No rules use this color.')
+        for rule in rules:
+            bfr.append('\nRule: %s' % rule.scope)
+            if rule.name:
+                bfr.append('Name: %s' % rule.name)
+            for scope in sorted(matcher.get_rule_scopes(rule.scope)):
+                bfr.append('    %s' % scope.strip())
+
+        window = self.view.window()
+        view = window.get_output_panel('scope_viewer')
+        ScopeHunterEditCommand.bfr = '\n'.join(bfr)
+        ScopeHunterEditCommand.pt = 0
+        view.run_command('scope_hunter_edit')
+        ScopeHunterEditCommand.clear()
+        window.run_command("show_panel", {"panel": "output.scope_viewer"})
+
+    def is_enabled(self):
+        """Check if we should scope this view."""
+
+        return sh_thread.is_enabled(self.view)
+
+
+class GetStyleRunsCommand(sublime_plugin.TextCommand):
+    """Command to show the runs of text with the same colors and style on the selected lines."""
+
+    def run(self, edit):
+        """Show the style runs of the lines under the cursors."""
+
+        matcher, loading = get_scheme_matcher(self.view)
+        if matcher is None:
+            notify("Color scheme is still loading" if loading else "Color scheme could not be loaded")
+            return
+
+        # Only the selected lines are scanned, the map just remembers the styles of the scopes it has seen.
+        smap = style_maps.get(self.view.id())
+        if smap is None or smap.matcher is not matcher:
+            smap = StyleMap(matcher)
+            style_maps[self.view.id()] = smap
+
+        bfr = []
+        rows = set()
+        for sel in self.view.sel():
+            for line in self.view.lines(sel):
+                row = self.view.rowcol(line.begin())[0]
+                if row in rows:
+                    continue
+                rows.add(row)
+                bfr.append('Line %d:' % (row + 1))
+                for start, end, style in smap.scan_style_runs(self.view, line.begin(), line.end()):
+                    bfr.append(
+                        '    (%d, %d) Fg: %s Bg: %s Style: %s' % (
+                            start, end, style.fg, style.bg, style.style if style.style else 'normal'
+                        )
+                    )
+
+        window = self.view.window()
+        view = window.get_output_panel('scope_viewer')
+        ScopeHunterEditCommand.bfr = '\n'.join(bfr)
+        ScopeHunterEditCommand.pt = 0
+        view.run_command('scope_hunter_edit')
+        ScopeHunterEditCommand.clear()
+        window.run_command("show_panel", {"panel": "output.scope_viewer"})
 
     def is_enabled(self):
         """Check if we should scope this view."""
@@ -569,8 +817,7 @@ class ToggleSelectionScopeCommand(sublime_plugin.ApplicationCommand):
 
         sh_thread.instant_scoper = False if sh_thread.instant_scoper else True
         if sh_thread.instant_scoper:
-            sh_thread.modified = True
-            sh_thread.time = time()
+            sh_thread.modify()
         else:
             win = sublime.active_window()
             if win is not None:
@@ -611,21 +858,27 @@ class SelectionScopeListener(sublime_plugin.EventListener):
             if enabled:
                 self.clear_regions(view)
         else:
-            sh_thread.modified = True
-            sh_thread.time = time()
+            sh_thread.modify(view)
+
+    def on_close(self, view):
+        """Forget the view's pending scoping."""
+
+        sh_thread.forget(view.id())
+        scope_caches.pop(view.id(), None)
+        style_maps.pop(view.id(), None)
+        get_selection_scopes.cancel(view)
+
+    def on_post_save(self, view):
+        """Reload the color scheme if it was the file saved."""
+
+        reload_color_scheme(view.file_name())
 
     def on_activated(self, view):
         """Check color scheme on activated and update if needed."""
 
         if not view.settings().get('is_widget', False):
-            scheme = view.settings().get("color_scheme")
-            if scheme is None:
-                pref_settings = sublime.load_settings('Preferences.sublime-settings')
-                scheme = pref_settings.get('color_scheme')
-
-            if scheme_matcher is not None and scheme is not None:
-                if scheme != scheme_matcher.scheme_file:
-                    reinit_plugin()
+            # Start loading the view's scheme early; pooled schemes cost nothing.
+            get_scheme_matcher(view)
 
 
 class ShThread(threading.Thread):
@@ -633,29 +886,74 @@ class ShThread(threading.Thread):
 
     def __init__(self):
         """Setup the thread."""
+        self.condition = threading.Condition()
         self.reset()
         threading.Thread.__init__(self)
 
     def reset(self):
         """Reset the thread variables."""
         self.wait_time = 0.12
-        self.time = time()
-        self.modified = False
+        # View id -> `(generation, time)` of the latest request still waiting to be scheduled
+        self.requests = {}
+        # View id -> generation of the latest request, scheduled or not
+        self.generations = {}
+        self.generation = 0
         self.ignore_all = False
         self.instant_scoper = False
         self.abort = False
 
-    def payload(self):
+    def modify(self, view=None, debounce=True):
+        """
+        Request scoping of the view (or the active view) and wake the thread.
+
+        Every request gets a newer generation, so results for older ones are
+        dropped.  With `debounce`, scoping waits until the view's selection
+        has not changed for `wait_time`.
+        """
+        if view is None:
+            window = sublime.active_window()
+            view = None if window is None else window.active_view()
+            if view is None:
+                return
+        with self.condition:
+            self.generation += 1
+            self.generations[view.id()] = self.generation
+            self.requests[view.id()] = (self.generation, time() if debounce else 0.0)
+            self.condition.notify()
+
+    def forget(self, view_id):
+        """Forget the requests of a closed view."""
+        with self.condition:
+            self.requests.pop(view_id, None)
+            self.generations.pop(view_id, None)
+
+    def payload(self, view_id, generation, changed):
         """Code to run."""
-        # Ignore selection inside the routine
-        self.modified = False
-        self.ignore_all = True
+        with self.condition:
+            if self.generations.get(view_id) != generation:
+                # The selection changed since, a newer payload is on its way.
+                return
         window = sublime.active_window()
         view = None if window is None else window.active_view()
-        if view is not None:
-            get_selection_scopes.run(view)
-        self.ignore_all = False
-        self.time = time()
+        if view is None or view.id() != view_id:
+            # The view is no longer active.
+            return
+
+        self.run_ignoring(get_selection_scopes.run, view)
+        if changed:
+            debug("Scoped %.1f ms after the selection changed" % ((time() - changed) * 1000))
+
+    def run_ignoring(self, func, *args):
+        """Run the function, ignoring the selection changes it causes."""
+
+        self.ignore_all = True
+        try:
+            func(*args)
+        finally:
+            with self.condition:
+                self.ignore_all = False
+                # Pick up requests made while ignoring selections.
+                self.condition.notify()
 
     def is_enabled(self, view):
         """Check if we can execute."""
@@ -663,48 +961,169 @@ class ShThread(threading.Thread):
 
     def kill(self):
         """Kill thread."""
-        self.abort = True
-        while self.is_alive():
-            pass
+        with self.condition:
+            self.abort = True
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
         self.reset()
 
     def run(self):
         """Thread loop."""
-        while not self.abort:
-            if not self.ignore_all:
-                if (
-                    self.modified is True and
-                    time() - self.time > self.wait_time
-                ):
-                    sublime.set_timeout(self.payload, 0)
-            sleep(0.5)
-
-
-def init_color_scheme():
-    """Setup color scheme match object with current scheme."""
+        with self.condition:
+            while not self.abort:
+                if not self.requests or self.ignore_all:
+                    # Sleep until there is something to do.
+                    self.condition.wait()
+                    continue
+                view_id, (generation, changed) = min(self.requests.items(), key=lambda r: r[1][1])
+                remaining = changed + self.wait_time - time()
+                if changed and remaining > 0:
+                    # Selection changes restart the wait.
+                    self.condition.wait(remaining)
+                    continue
+                del self.requests[view_id]
+                sublime.set_timeout(partial(self.payload, view_id, generation, changed), 0)
+
+
+def get_view_scheme(view):
+    """Get the color scheme file of the view."""
 
-    global scheme_matcher
     scheme_file = None
-
-    # Attempt syntax specific from view
-    window = sublime.active_window()
-    if window is not None:
-        view = window.active_view()
-        if view is not None:
-            scheme_file = view.settings().get('color_scheme', None)
+    if view is not None:
+        scheme_file = view.settings().get('color_scheme', None)
 
     # Get global scheme
     if scheme_file is None:
         pref_settings = sublime.load_settings('Preferences.sublime-settings')
         scheme_file = pref_settings.get('color_scheme')
+    return scheme_file
+
+
+def get_scheme_matcher(view):
+    """
+    Get the color scheme match object for the view.
+
+    Returns the match object and whether the scheme is still loading.  If the
+    scheme is not in the pool, it is loaded in the background.
+    """
+
+    scheme_file = get_view_scheme(view)
+    if scheme_file is None:
+        return None, False
+    key = path.normpath(scheme_file)
+
+    with scheme_lock:
+        matcher = scheme_pool.get(key)
+        if matcher is not None:
+            # Failed schemes are pooled as `False` so they are not retried constantly.
+            return matcher or None, False
+        if key in scheme_loading:
+            return None, True
+        scheme_loading.add(key)
+        generation = scheme_generations[key] = scheme_generations.get(key, 0) + 1
+
+    loader = threading.Thread(target=load_color_scheme, args=(scheme_file, key, generation))
+    loader.daemon = True
+    loader.start()
+    return None, True
+
+
+def load_color_scheme(scheme_file, key, generation, previous=None, matched=None):
+    """
+    Build the color scheme match object in the background and pool it when ready.
+
+    When reloading an edited scheme, `previous` is the pooled match object,
+    and `matched` a snapshot of its matched scopes.  The scopes the edit did
+    not affect are carried over.  The object is only pooled if no newer load
+    of the scheme was started in the meantime.
+    """
 
     try:
-        scheme_matcher = ColorSchemeMatcher(scheme_file)
+        matcher = ColorSchemeMatcher(
+            scheme_file,
+            cache_size=int(sh_settings.get("matched_cache_size", 1000)),
+            cache_dir=path.join(sublime.cache_path(), 'ScopeHunter')
+        )
     except Exception:
-        scheme_matcher = None
+        matcher = False
         log("Theme parsing failed!  Ignoring theme related info.")
         debug(str(traceback.format_exc()))
 
+    if matcher and previous is not None:
+        try:
+            kept = matcher.inherit_matched(previous, matched)
+            debug("Reloaded scheme: %s (%d of %d matched scopes kept)" % (scheme_file, kept, len(matched)))
+        except Exception:
+            # The new match object is fine, it just starts without matched scopes.
+            matcher.matched.clear()
+            matcher.rule_scopes.clear()
+            log("Could not carry over the matched scopes of the reloaded scheme.")
+            debug(str(traceback.format_exc()))
+
+    with scheme_lock:
+        if scheme_generations.get(key) != generation:
+            debug("Discarded outdated load of scheme: %s" % scheme_file)
+            return
+        scheme_pool[key] = matcher
+        scheme_loading.discard(key)
+        debug("Scheme pool: %s" % str(scheme_pool.stats()))
+    debug("Color cache: %s" % str(get_color_cache_stats()))
+
+    if sh_thread is not None and sh_thread.instant_scoper:
+        # Refresh the instant scoper now that colors are available.
+        sh_thread.modify()
+
+
+def reload_color_scheme(file_name):
+    """Reload a pooled color scheme after its file was saved."""
+
+    packages = sublime.packages_path()
+    if file_name is None or path.splitext(file_name)[1].lower() not in ('.tmtheme', '.sublime-color-scheme'):
+        return
+    try:
+        relative = path.relpath(file_name, packages)
+    except ValueError:
+        # Different drive
+        return
+    if relative.startswith(path.pardir):
+        return
+    key = path.normpath(path.join('Packages', relative))
+
+    with scheme_lock:
+        previous = scheme_pool.get(key)
+        if previous is False:
+            # The scheme failed to load, so give it another chance when it is next needed.
+            scheme_pool.pop(key)
+        if not previous:
+            return
+        generation = scheme_generations[key] = scheme_generations.get(key, 0) + 1
+
+    # Scopes are matched on this thread, so the snapshot is consistent.
+    matched = previous.matched.items()
+    debug("Matched scope cache: %s %s" % (key, str(previous.get_cache_stats())))
+    loader = threading.Thread(
+        target=load_color_scheme, args=(previous.get_scheme_file(), key, generation, previous, matched)
+    )
+    loader.daemon = True
+    loader.start()
+
+
+def init_color_scheme():
+    """Setup color scheme match object with current scheme."""
+
+    with scheme_lock:
+        scheme_pool.resize(int(sh_settings.get("scheme_pool_size", 4)))
+        # Give schemes that failed to load another chance.
+        for key, matcher in scheme_pool.items():
+            if matcher is False:
+                scheme_pool.pop(key)
+            else:
+                debug("Matched scope cache: %s %s" % (key, str(matcher.get_cache_stats())))
+
+    window = sublime.active_window()
+    get_scheme_matcher(window.active_view() if window is not None else None)
+
 
 def reinit_plugin():
     """Relaod scheme object and tooltip theme."""
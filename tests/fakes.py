@@ -0,0 +1,132 @@
+"""Fake Sublime Text API, so the library modules can be tested outside of Sublime."""
+import sys
+import types
+from lib.scope_selector import compile_selector
+
+# Resource name -> content returned by `load_binary_resource`.
+resources = {}
+
+
+class Region(object):
+    """Region."""
+
+    def __init__(self, a, b=None):
+        """Initialize."""
+
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        """Get the start of the region."""
+
+        return min(self.a, self.b)
+
+    def end(self):
+        """Get the end of the region."""
+
+        return max(self.a, self.b)
+
+    def size(self):
+        """Get the size of the region."""
+
+        return self.end() - self.begin()
+
+    def contains(self, pt):
+        """Check if the point is in the region."""
+
+        return self.begin() <= pt <= self.end()
+
+    def __eq__(self, other):
+        """Compare regions."""
+
+        return (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        """Represent the region."""
+
+        return 'Region(%d, %d)' % (self.a, self.b)
+
+
+def load_binary_resource(name):
+    """Get the content of a resource."""
+
+    if name not in resources:
+        raise IOError('resource not found: %s' % name)
+    return resources[name]
+
+
+if 'sublime' not in sys.modules:
+    sublime = types.ModuleType('sublime')
+    sublime.Region = Region
+    sublime.platform = lambda: 'linux'
+    sublime.load_binary_resource = load_binary_resource
+    sys.modules['sublime'] = sublime
+
+
+class View(object):
+    """A view of some text, scoped by a function that gives the scope of every character."""
+
+    def __init__(self, text, scoper):
+        """Initialize."""
+
+        self.scoper = scoper
+        self.set_text(text)
+
+    def set_text(self, text):
+        """Replace the text and scope it."""
+
+        self.text = text
+        self.scopes = self.scoper(text)
+        # Like Sublime, the end of the buffer has the scope of the last character.
+        self.scopes.append(self.scopes[-1] if self.scopes else 'source ')
+
+    def size(self):
+        """Get the size of the buffer."""
+
+        return len(self.text)
+
+    def scope_name(self, pt):
+        """Get the scope at the point."""
+
+        return self.scopes[pt]
+
+    def line(self, pt):
+        """Get the line of the point without its newline."""
+
+        begin = self.text.rfind('\n', 0, pt) + 1
+        end = self.text.find('\n', pt)
+        return Region(begin, len(self.text) if end == -1 else end)
+
+    def full_line(self, pt):
+        """Get the line of the point with its newline."""
+
+        region = self.line(pt)
+        return Region(region.a, min(region.b + 1, len(self.text)))
+
+    def match_selector(self, pt, selector):
+        """Check if the scope at the point matches the selector."""
+
+        return compile_selector(selector).score(self.scope_name(pt)) > 0
+
+    def find_by_selector(self, selector):
+        """Get the regions of text whose scopes match the selector."""
+
+        regions = []
+        for pt in range(self.size()):
+            if self.match_selector(pt, selector):
+                if regions and regions[-1].b == pt:
+                    regions[-1].b = pt + 1
+                else:
+                    regions.append(Region(pt, pt + 1))
+        return regions
+
+    def extract_scope(self, pt):
+        """Get the extent of the innermost scope name at the point."""
+
+        name = self.scope_name(pt).split()[-1]
+        begin = end = pt
+        while begin > 0 and name in self.scope_name(begin - 1).split():
+            begin -= 1
+        while end < self.size() and name in self.scope_name(end).split():
+            end += 1
+        return Region(begin, max(end, pt + 1))
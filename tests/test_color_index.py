@@ -0,0 +1,50 @@
+"""Test the color index."""
+import unittest
+import random
+from lib import color_index
+
+
+class TestColorIndex(unittest.TestCase):
+    """Test nearest color queries."""
+
+    def assert_lab(self, color, expected):
+        """Assert the Lab coordinates of the color."""
+
+        for value, reference in zip(color_index.rgb_to_lab(color), expected):
+            self.assertAlmostEqual(value, reference, places=2)
+
+    def test_lab(self):
+        """Test conversion to CIE Lab."""
+
+        self.assert_lab('#FFFFFF', (100.0, 0.0, 0.0))
+        self.assert_lab('#000000', (0.0, 0.0, 0.0))
+        self.assert_lab('#FF0000', (53.24, 80.09, 67.20))
+        self.assert_lab('#0000FF80', (32.30, 79.19, -107.86))
+
+    def test_nearest(self):
+        """Test the tree finds the same colors as comparing every color."""
+
+        rand = random.Random(7)
+        palette = ['#%06X' % rand.randrange(0x1000000) for _ in range(300)]
+        palette += palette[:20]
+        index = color_index.ColorIndex((color, i) for i, color in enumerate(palette))
+        labs = [color_index.rgb_to_lab(color) for color in palette]
+
+        for _ in range(200):
+            target = '#%06X' % rand.randrange(0x1000000)
+            lab = color_index.rgb_to_lab(target)
+            expected = sorted(sum((a - b) ** 2 for a, b in zip(lab, other)) ** 0.5 for other in labs)
+            for k in (1, 5, 12):
+                found = index.nearest(target, k)
+                self.assertEqual(len(found), k)
+                for (distance, color, payload), reference in zip(found, expected):
+                    self.assertAlmostEqual(distance, reference)
+                    self.assertEqual(palette[payload], color)
+
+    def test_small(self):
+        """Test queries asking for more colors than indexed."""
+
+        index = color_index.ColorIndex([('#FFFFFF', 'white'), ('#000000', 'black')])
+        self.assertEqual([p for d, c, p in index.nearest('#202020', 5)], ['black', 'white'])
+        self.assertEqual(index.nearest('#202020', 0), [])
+        self.assertEqual(color_index.ColorIndex([]).nearest('#202020'), [])
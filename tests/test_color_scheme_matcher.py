@@ -0,0 +1,419 @@
+"""Test the color scheme matcher."""
+import unittest
+import json
+import random
+import shutil
+import tempfile
+from . import fakes
+from lib import color_scheme_matcher as csm
+
+SCHEME = """
+// A commented scheme with a dangling comma.
+{
+    "name": "Test",
+    "variables": {
+        "black": "#000000",
+        "white": "hsl(0, 0%, 100%)",
+        "red": "rgb(255, 0, 0)",
+        "accent": "var(red)",
+        "faded": "color(var(accent) alpha(50%))",
+        "loop": "var(loop)"
+    },
+    "globals": {
+        "background": "var(black)",
+        "foreground": "var(white)",
+        "caret": "var(red)",
+        "selection": "color(var(white) blend(var(black) 25%))",
+    },
+    "rules": [
+        {"name": "Comment", "scope": "comment", "foreground": "var(faded)", "font_style": "italic"},
+        {"scope": "string", "foreground": "color(var(red) lightness(+ 10%))", "font_style": "bold italic"},
+        {"scope": "keyword", "background": "rgba(0, 0, 255, 0.5)", "font_style": "underline"},
+        {"scope": "constant", "foreground": ["var(red)", "var(white)"], "font_style": ""},
+        {"scope": "invalid", "foreground": "var(missing)"}
+    ]
+}
+"""
+
+
+class TestVariables(unittest.TestCase):
+    """Test resolving variables."""
+
+    def test_resolve(self):
+        """Test references are resolved, and circular ones are left alone."""
+
+        variables = csm.resolve_variables(
+            {"a": "#102030", "b": "var(a)", "c": "color(var(b) alpha(0.5))", "d": "var(e)", "e": "var(d)"}
+        )
+        self.assertEqual(variables["b"], "#102030")
+        self.assertEqual(variables["c"], "color(#102030 alpha(0.5))")
+        self.assertIn("var(", variables["d"])
+
+
+class TestTranslateColor(unittest.TestCase):
+    """Test translating color values."""
+
+    def translate(self, value, variables=None):
+        """Translate the color."""
+
+        return csm.translate_color(value, variables or {})
+
+    def test_colors(self):
+        """Test hex, `rgb()`, and `hsl()` colors."""
+
+        self.assertEqual(self.translate('#abc'), '#abc')
+        self.assertEqual(self.translate('rgb(255, 128, 0)'), '#FF8000')
+        self.assertEqual(self.translate('rgba(255, 128, 0, 0.5)'), '#FF800080')
+        self.assertEqual(self.translate('rgba(255, 128, 0, 25%)'), '#FF800040')
+        self.assertEqual(self.translate('hsl(120, 100%, 50%)'), '#00FF00')
+        self.assertEqual(self.translate('hsla(240deg, 100%, 50%, 0.5)'), '#0000FF80')
+        self.assertEqual(self.translate(['var(a)', '#FFFFFF'], {'a': '#123456'}), '#123456')
+        self.assertIsNone(self.translate('var(missing)'))
+        self.assertIsNone(self.translate('not a color'))
+        self.assertIsNone(self.translate(None))
+
+    def test_alpha(self):
+        """Test the alpha adjuster."""
+
+        self.assertEqual(self.translate('color(#FF0000 alpha(0.5))'), '#FF000080')
+        self.assertEqual(self.translate('color(#FF0000 a(25%))'), '#FF000040')
+        self.assertEqual(self.translate('color(#FF000080 alpha(+ 0.25))'), '#FF0000C0')
+        self.assertEqual(self.translate('color(#FF000080 alpha(* 0.5))'), '#FF000040')
+        self.assertEqual(self.translate('color(#FF0000 alpha(2))'), '#FF0000')
+
+    def test_blend(self):
+        """Test the blend adjusters keep the given percentage of the base color."""
+
+        self.assertEqual(self.translate('color(#FFFFFF blend(#000000 25%))'), '#404040')
+        self.assertEqual(self.translate('color(#FFFFFF blend(rgb(0, 0, 0) 100%))'), '#FFFFFF')
+        self.assertEqual(self.translate('color(#FFFFFF blend(#00000000 50%))'), '#808080')
+        self.assertEqual(self.translate('color(#FFFFFF blenda(#00000000 50%))'), '#80808080')
+
+    def test_hsl(self):
+        """Test the lightness and saturation adjusters."""
+
+        self.assertEqual(self.translate('color(#FF0000 lightness(25%))'), '#800000')
+        self.assertEqual(self.translate('color(#FF0000 l(- 25%))'), '#800000')
+        self.assertEqual(self.translate('color(#FF0000 saturation(0%))'), '#808080')
+        self.assertEqual(self.translate('color(#BF4040 s(* 2))'), '#FF0000')
+
+    def test_nested(self):
+        """Test adjusters applied in turn, and nested modifications."""
+
+        self.assertEqual(
+            self.translate('color(color(var(c) lightness(25%)) alpha(0.5) blenda(#FFFFFF 50%))', {'c': '#FF0000'}),
+            '#C08080C0'
+        )
+        self.assertIsNone(self.translate('color(#FF0000 blur(2))'))
+        self.assertIsNone(self.translate('color(#FF0000 alpha(lots))'))
+        self.assertIsNone(self.translate('color(var(missing) alpha(0.5))'))
+
+
+class TestReadJson(unittest.TestCase):
+    """Test loading `.sublime-color-scheme` files."""
+
+    def setUp(self):
+        """Load the test scheme."""
+
+        fakes.resources['Packages/Test/Test.sublime-color-scheme'] = SCHEME.encode('utf-8')
+        self.matcher = csm.ColorSchemeMatcher('Packages/Test/Test.sublime-color-scheme')
+
+    def guess(self, scope):
+        """Get the colors of the scope."""
+
+        return self.matcher.guess_color(None, 0, scope)
+
+    def test_globals(self):
+        """Test the general colors."""
+
+        background, foreground, selection = self.matcher.get_general_colors()[:3]
+        self.assertEqual((background, foreground, selection), ('#000000', '#FFFFFF', '#404040'))
+
+    def test_rules(self):
+        """Test the rule colors and font styles."""
+
+        comment = self.guess('source.python comment.line ')
+        self.assertEqual((comment.fg, comment.style), ('#FF000080', 'italic'))
+        self.assertEqual(comment.fg_simulated, '#800000')
+
+        string = self.guess('source.python string.quoted ')
+        self.assertEqual((string.fg, string.style), ('#FF3333', 'bold italic'))
+
+        keyword = self.guess('source.python keyword.control ')
+        self.assertEqual((keyword.fg, keyword.bg, keyword.style), ('#FFFFFF', '#0000FF80', 'normal'))
+
+        constant = self.guess('source.python constant.numeric ')
+        self.assertEqual((constant.fg, constant.style), ('#FF0000', 'normal'))
+
+        invalid = self.guess('source.python invalid.illegal ')
+        self.assertEqual(invalid.fg, '#FFFFFF')
+        self.assertEqual(invalid.fg_selector.name, 'foreground')
+
+    def test_strict(self):
+        """Test strict JSON loads the same as sanitized JSON."""
+
+        scheme = json.loads(csm.sanitize_json(SCHEME))
+        self.assertEqual(
+            self.matcher.read_json(json.dumps(scheme).encode('utf-8')),
+            self.matcher.read_json(SCHEME.encode('utf-8'))
+        )
+
+
+class TestCache(unittest.TestCase):
+    """Test the parsed scheme cache."""
+
+    scopes = (
+        'source.python comment.line ',
+        'source.python string.quoted ',
+        'source.python keyword.control ',
+        'source.python constant.numeric '
+    )
+
+    def setUp(self):
+        """Cache the test scheme."""
+
+        self.cache_dir = tempfile.mkdtemp()
+        fakes.resources['Packages/Test/Test.sublime-color-scheme'] = SCHEME.encode('utf-8')
+        self.matcher = self.load()
+        self.expected = self.colors(self.matcher)
+
+    def tearDown(self):
+        """Remove the cache."""
+
+        shutil.rmtree(self.cache_dir)
+
+    def load(self):
+        """Load the test scheme through the cache."""
+
+        return csm.ColorSchemeMatcher('Packages/Test/Test.sublime-color-scheme', cache_dir=self.cache_dir)
+
+    def colors(self, matcher):
+        """Get the general colors and the colors of the test scopes."""
+
+        return matcher.get_general_colors(), [tuple(matcher.guess_color(None, 0, scope)[:4]) for scope in self.scopes]
+
+    def corrupt(self, edit):
+        """Rewrite the cache file with an edit applied to it."""
+
+        with open(self.matcher.cache_file, 'r') as f:
+            cache = json.load(f)
+        cache = edit(cache)
+        with open(self.matcher.cache_file, 'w') as f:
+            f.write(cache if isinstance(cache, str) else json.dumps(cache))
+
+    def assert_rebuilt(self):
+        """Check a corrupted cache is parsed again and rewritten."""
+
+        self.assertEqual(self.colors(self.load()), self.expected)
+        with open(self.matcher.cache_file, 'r') as f:
+            self.assertIn('colors', json.load(f))
+        self.assertTrue(self.load().load_cache())
+
+    def test_cached(self):
+        """Test a current cache is loaded."""
+
+        self.assertTrue(self.matcher.load_cache())
+        self.assertEqual(self.colors(self.load()), self.expected)
+
+    def test_truncated(self):
+        """Test a truncated cache is a miss."""
+
+        self.corrupt(lambda cache: json.dumps(cache)[:100])
+        self.assertFalse(self.matcher.load_cache())
+        self.assert_rebuilt()
+
+    def test_missing_key(self):
+        """Test a cache missing general colors is a miss."""
+
+        def edit(cache):
+            del cache['general']['bground']
+            return cache
+
+        self.corrupt(edit)
+        self.assertFalse(self.matcher.load_cache())
+        self.assert_rebuilt()
+
+    def test_wrong_types(self):
+        """Test a cache with values of the wrong type is a miss."""
+
+        def edit(cache):
+            cache['colors'] = 1
+            return cache
+
+        self.corrupt(edit)
+        self.assertFalse(self.matcher.load_cache())
+        self.assert_rebuilt()
+
+        self.corrupt(lambda cache: [cache])
+        self.assertFalse(self.matcher.load_cache())
+        self.assert_rebuilt()
+
+    def test_malformed_rule(self):
+        """Test a cache with an incomplete rule is a miss."""
+
+        def edit(cache):
+            del cache['colors'][0]['style']
+            return cache
+
+        self.corrupt(edit)
+        self.assertFalse(self.matcher.load_cache())
+        self.assert_rebuilt()
+
+
+class TestInherit(unittest.TestCase):
+    """Test carrying matched scopes over to an edited scheme."""
+
+    selectors = (
+        'string', 'string.quoted', 'string.quoted.double', 'source string', 'source.python string',
+        'comment', 'comment.line', 'source comment', 'keyword', 'keyword.control', 'source - comment',
+        'meta string', 'string, comment', 'constant'
+    )
+
+    scopes = (
+        'source.python string.quoted.double.python ',
+        'source.python string.quoted.single.python ',
+        'source.python meta.string string.quoted.double.python ',
+        'source.python comment.line.number-sign.python ',
+        'source.python comment.block.python ',
+        'source.python keyword.control.flow.python ',
+        'source.python meta.function keyword.control.python ',
+        'source.python constant.numeric.python ',
+        'text.plain string.unquoted ',
+        'source.python '
+    )
+
+    def load(self, rules):
+        """Load a scheme with the given `(scope, foreground, font_style)` rules."""
+
+        scheme = {
+            'globals': {'background': '#000000', 'foreground': '#FFFFFF'},
+            'rules': [
+                dict((key, value) for key, value in zip(('scope', 'foreground', 'font_style'), rule) if value)
+                for rule in rules
+            ]
+        }
+        fakes.resources['Packages/Test/Inherit.sublime-color-scheme'] = json.dumps(scheme).encode('utf-8')
+        return csm.ColorSchemeMatcher('Packages/Test/Inherit.sublime-color-scheme')
+
+    def colors(self, matcher):
+        """Get the colors of every test scope."""
+
+        return [tuple(matcher.guess_color(None, 0, scope)[:5]) for scope in self.scopes]
+
+    def inherit(self, old_rules, new_rules):
+        """Inherit the matched scopes of the old rules, and compare the colors with a fresh parse."""
+
+        previous = self.load(old_rules)
+        self.colors(previous)
+        matcher = self.load(new_rules)
+        kept = matcher.inherit_matched(previous)
+        self.assertEqual(self.colors(matcher), self.colors(self.load(new_rules)))
+        return kept
+
+    def test_removed_blocking_rule(self):
+        """Test removing a rule that won nothing, but blocked a lower scored style."""
+
+        rules = [
+            ('string', '#FF0000', 'bold'),
+            ('string.quoted', '#00FF00', ''),
+            ('source string', '#FF0000', 'italic'),
+            ('string.quoted.double', '#0000FF', '')
+        ]
+        self.inherit(rules, rules[:1] + rules[2:])
+
+    def test_unchanged(self):
+        """Test every matched scope is kept when nothing changed."""
+
+        rules = [('string', '#FF0000', 'bold'), ('comment', '#00FF00', 'italic')]
+        self.assertEqual(self.inherit(rules, rules), len(self.scopes))
+
+    def test_random_edits(self):
+        """Test random removals, changes, and additions match a fresh parse."""
+
+        rand = random.Random(19)
+        colors = ('#FF0000', '#00FF00', '#0000FF')
+        styles = ('', 'bold', 'italic', 'bold italic')
+        for _ in range(200):
+            rules = [
+                (selector, rand.choice(colors), rand.choice(styles))
+                for selector in rand.sample(self.selectors, rand.randint(1, len(self.selectors)))
+            ]
+            edited = []
+            for rule in rules:
+                action = rand.random()
+                if action < 0.2:
+                    continue
+                if action < 0.4:
+                    rule = (rule[0], rand.choice(colors), rand.choice(styles))
+                edited.append(rule)
+            unused = [selector for selector in self.selectors if selector not in [rule[0] for rule in edited]]
+            if unused and rand.random() < 0.5:
+                edited.insert(rand.randint(0, len(edited)), (rand.choice(unused), rand.choice(colors), ''))
+            self.inherit(rules, edited)
+
+
+class TestRuleIndex(unittest.TestCase):
+    """Test indexing rules by color and matched scopes by rule."""
+
+    def load(self, rules, cache_size=1000):
+        """Load a scheme with the given `(scope, foreground, background)` rules."""
+
+        scheme = {
+            'globals': {'background': '#000000', 'foreground': '#FFFFFF'},
+            'rules': [
+                dict((key, value) for key, value in zip(('scope', 'foreground', 'background'), rule) if value)
+                for rule in rules
+            ]
+        }
+        fakes.resources['Packages/Test/Index.sublime-color-scheme'] = json.dumps(scheme).encode('utf-8')
+        return csm.ColorSchemeMatcher('Packages/Test/Index.sublime-color-scheme', cache_size=cache_size)
+
+    def test_color_rules(self):
+        """Test differently written colors find the same rules."""
+
+        matcher = self.load(
+            [
+                ('string', '#abc', None), ('comment', '#AABBCC', None),
+                ('keyword', None, '#AABBCCFF'), ('constant', '#ABC', None)
+            ]
+        )
+        for color in ('#abc', '#AABBCC', '#aabbccff', ' #AABBCCFF'):
+            self.assertEqual(
+                [rule.scope for rule in matcher.get_color_rules(color)], ['string', 'comment', 'keyword', 'constant']
+            )
+        self.assertEqual(matcher.get_color_rules('#AABBCC80'), [])
+
+    def test_evictions(self):
+        """Test evicted scopes are removed from the rules that won them."""
+
+        matcher = self.load([('string', '#FF0000', None), ('comment', '#00FF00', '#000000')], cache_size=2)
+        matcher.guess_color(None, 0, 'source string.quoted ')
+        matcher.guess_color(None, 0, 'source comment.line ')
+        self.assertEqual(matcher.get_rule_scopes('string'), set(['source string.quoted ']))
+        self.assertEqual(matcher.get_rule_scopes('comment'), set(['source comment.line ']))
+
+        matcher.guess_color(None, 0, 'source string.unquoted ')
+        self.assertEqual(matcher.get_rule_scopes('string'), set(['source string.unquoted ']))
+        self.assertEqual(matcher.get_rule_scopes('comment'), set(['source comment.line ']))
+
+        matcher.guess_color(None, 0, 'source string.other ')
+        self.assertEqual(matcher.get_rule_scopes('string'), set(['source string.unquoted ', 'source string.other ']))
+        self.assertEqual(matcher.get_rule_scopes('comment'), set())
+        self.assertNotIn(matcher.colors['comment'].id, matcher.rule_scopes)
+        self.assertEqual(matcher.get_rule_scopes('missing'), set())
+
+    def test_inherit(self):
+        """Test inherited scopes are indexed by the ids of the new rules."""
+
+        previous = self.load([('string', '#FF0000', None), ('keyword', '#0000FF', None), ('comment', '#00FF00', None)])
+        for scope in ('source string.quoted ', 'source comment.line ', 'source keyword.control '):
+            previous.guess_color(None, 0, scope)
+
+        matcher = self.load([('string', '#FF0000', None), ('comment', '#00FF00', None)])
+        self.assertEqual(matcher.inherit_matched(previous), 2)
+        self.assertEqual(matcher.colors['comment'].id, 1)
+        self.assertEqual(matcher.get_rule_scopes('string'), set(['source string.quoted ']))
+        self.assertEqual(matcher.get_rule_scopes('comment'), set(['source comment.line ']))
+        self.assertEqual(matcher.get_rule_scopes('keyword'), set())
+        self.assertEqual(matcher.rule_scopes, {0: set(['source string.quoted ']), 1: set(['source comment.line '])})
+        self.assertEqual(matcher.guess_color(None, 0, 'source comment.line ').fg, '#00FF00')
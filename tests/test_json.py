@@ -3,6 +3,8 @@ import unittest
 from . import validate_json_format
 import os
 import fnmatch
+import json
+from lib.file_strip.json import sanitize_json
 
 
 class TestSettings(unittest.TestCase):
@@ -36,3 +38,51 @@ class TestSettings(unittest.TestCase):
                     validate_json_format.CheckJsonFormat(False, True).check_format(f),
                     "%s does not comform to expected format!" % f
                 )
+
+
+class TestSanitize(unittest.TestCase):
+    """Test stripping comments and dangling commas."""
+
+    def assert_sanitized(self, text, expected):
+        """Assert both ways of sanitizing give the expected JSON."""
+
+        self.assertEqual(json.loads(sanitize_json(text)), expected)
+        self.assertEqual(json.loads(sanitize_json(text, preserve_lines=True)), expected)
+
+    def test_comments(self):
+        """Test line and block comments."""
+
+        self.assert_sanitized(
+            '// leading\n{\n  "a": 1, // trailing\n  /* block\n comment */ "b": [2, /* inline */ 3]\n}\n',
+            {"a": 1, "b": [2, 3]}
+        )
+
+    def test_dangling_commas(self):
+        """Test dangling commas before brackets, with whitespace and comments in between."""
+
+        self.assert_sanitized(
+            '{"a": [1, 2,], "b": {"c": 3,\n},\n "d": [4, // four\n ], "e": {"f": 5, /* five */\n}, }',
+            {"a": [1, 2], "b": {"c": 3}, "d": [4], "e": {"f": 5}}
+        )
+
+    def test_strings(self):
+        """Test strings that look like comments or dangling commas are kept."""
+
+        self.assert_sanitized(
+            '{"url": "http://example.com", "block": "/* not a comment */", "list": ",]", "obj": ",}",'
+            ' "quote": "\\" // still a string", "path": "a\\\\"}',
+            {
+                "url": "http://example.com",
+                "block": "/* not a comment */",
+                "list": ",]",
+                "obj": ",}",
+                "quote": '" // still a string',
+                "path": "a\\"
+            }
+        )
+
+    def test_preserve_lines(self):
+        """Test preserving lines keeps everything on its line."""
+
+        text = '{\n  /* one\n two */\n  "a": 1, // one\n}\n'
+        self.assertEqual(sanitize_json(text, preserve_lines=True).count('\n'), text.count('\n'))
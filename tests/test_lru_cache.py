@@ -0,0 +1,84 @@
+"""Test the LRU cache."""
+import unittest
+import threading
+from lib.lru_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test the LRU cache."""
+
+    def test_eviction(self):
+        """Test the least recently used entries are evicted to respect the capacity."""
+
+        cache = LRUCache(3)
+        for key in 'abc':
+            cache[key] = key.upper()
+        self.assertEqual(cache.get('a'), 'A')
+        cache['d'] = 'D'
+        self.assertEqual(list(cache), ['c', 'a', 'd'])
+        self.assertNotIn('b', cache)
+        self.assertEqual(len(cache), 3)
+
+        cache['c'] = 'C2'
+        cache.resize(1)
+        self.assertEqual(cache.items(), [('c', 'C2')])
+        self.assertEqual(LRUCache(0).capacity, 1)
+
+    def test_stats(self):
+        """Test hits, misses, and evictions are counted."""
+
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache.get('a')
+        cache.get('x')
+        self.assertIn('b', cache)
+        cache['c'] = 3
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'evictions': 1, 'size': 2, 'capacity': 2})
+
+        # Clearing and popping keep the statistics, and are not evictions.
+        cache.pop('a')
+        cache.clear()
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'evictions': 1, 'size': 0, 'capacity': 2})
+        self.assertIsNone(cache.pop('missing'))
+
+    def test_on_evict(self):
+        """Test the callback gets every evicted entry, but not removed ones."""
+
+        evicted = []
+        cache = LRUCache(2, lambda key, value: evicted.append((key, value)))
+        for i in range(5):
+            cache[i] = i * 10
+        self.assertEqual(evicted, [(0, 0), (1, 10), (2, 20)])
+        cache.resize(1)
+        self.assertEqual(evicted[-1], (3, 30))
+        cache.pop(4)
+        cache[5] = 50
+        cache.clear()
+        self.assertEqual(len(evicted), 4)
+
+    def test_iterate_while_changing(self):
+        """Test iterating while another thread changes the cache."""
+
+        cache = LRUCache(100)
+        done = threading.Event()
+
+        def churn():
+            """Keep adding entries."""
+
+            i = 0
+            while not done.is_set():
+                cache[i] = i
+                i += 1
+
+        thread = threading.Thread(target=churn)
+        thread.start()
+        try:
+            for _ in range(2000):
+                keys = list(cache)
+                self.assertLessEqual(len(keys), 100)
+                self.assertLessEqual(len(cache), 100)
+        finally:
+            done.set()
+            thread.join()
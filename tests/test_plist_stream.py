@@ -0,0 +1,83 @@
+"""Test the plist stream parser."""
+import unittest
+import plistlib
+import datetime
+from lib.plist_stream import PlistStream
+
+SCHEME = {
+    'name': 'Test',
+    'uuid': 'B1A6B8D2-2C04-4B25-A0B5-5D4E2C33F7B9',
+    'settings': [
+        {'settings': {'background': '#272822', 'foreground': '#F8F8F2'}},
+        {'name': 'Comment', 'scope': 'comment', 'settings': {'foreground': '#75715E', 'fontStyle': 'italic'}},
+        {'name': 'String', 'scope': 'string, meta.string', 'settings': {'foreground': '#E6DB74'}},
+        {'scope': 'markup.bold', 'settings': {'fontStyle': 'bold'}}
+    ],
+    'nested': {'list': [1, [2.5, -3], {'deep': {'deeper': ['&lt;', '<&>']}}], 'empty': {}, 'none': []},
+    'integer': 42,
+    'negative': -7,
+    'real': 0.25,
+    'yes': True,
+    'no': False,
+    'data': b'\x00\x01binary\xff' * 20,
+    'date': datetime.datetime(2015, 6, 7, 8, 9, 10),
+    'unicode': 'café ☃'
+}
+
+
+class TestPlistStream(unittest.TestCase):
+    """Test the parser against `plistlib`."""
+
+    def test_values(self):
+        """Test every kind of value."""
+
+        content = plistlib.dumps(SCHEME)
+        self.assertEqual(PlistStream().parse(content), plistlib.loads(content))
+
+    def test_chunks(self):
+        """Test values spanning the chunks the content is fed in."""
+
+        plist = {
+            'settings': [{'scope': 'source.s%d' % i, 'settings': {'foreground': '#%06X' % i}} for i in range(5000)]
+        }
+        content = plistlib.dumps(plist)
+        self.assertGreater(len(content), 64 * 1024 * 2)
+        self.assertEqual(PlistStream().parse(content), plist)
+
+    def test_comments(self):
+        """Test comments before the XML declaration and inside the plist."""
+
+        content = plistlib.dumps(SCHEME)
+        commented = content.replace(b'<dict>', b'<dict><!-- inline <key>ignored</key> -->', 1).replace(
+            b'<key>integer</key>', b'<!-- before a key --><key>integer</key><!-- after a key -->'
+        )
+        commented = b''.join([b'<!-- leading comment -->\n  <!-- another\n one -->\n', commented])
+        self.assertEqual(PlistStream().parse(commented), plistlib.loads(content))
+
+    def test_date(self):
+        """Test dates with trailing fields left off."""
+
+        content = plistlib.dumps({'date': datetime.datetime(2015, 1, 1)}).replace(
+            b'2015-01-01T00:00:00Z', b'2015Z'
+        )
+        self.assertEqual(PlistStream().parse(content), {'date': datetime.datetime(2015, 1, 1)})
+
+    def test_on_setting(self):
+        """Test the top level settings are streamed to the callback and left out of the tree."""
+
+        settings = []
+        content = plistlib.dumps(SCHEME)
+        root = PlistStream(settings.append).parse(content)
+        expected = plistlib.loads(content)
+        self.assertEqual(settings, expected.pop('settings'))
+        self.assertEqual(root.pop('settings'), [])
+        self.assertEqual(root, expected)
+
+    def test_on_setting_nested(self):
+        """Test arrays named `settings` below the top level are kept in the tree."""
+
+        settings = []
+        plist = {'settings': [{'settings': {'background': '#FFFFFF'}}], 'other': {'settings': [1, 2]}}
+        root = PlistStream(settings.append).parse(plistlib.dumps(plist))
+        self.assertEqual(settings, plist['settings'])
+        self.assertEqual(root['other'], {'settings': [1, 2]})
@@ -0,0 +1,359 @@
+"""Test RGBA."""
+import unittest
+import decimal
+import os
+import struct
+from lib import rgba
+
+
+def decimal_round_int(dec):
+    """Round with the reference `ROUND_HALF_UP` rounding."""
+
+    return int(decimal.Decimal(dec).quantize(decimal.Decimal('0'), decimal.ROUND_HALF_UP))
+
+
+def neighbors(value):
+    """Get the floats directly below and above the value."""
+
+    bits = struct.unpack('<q', struct.pack('<d', value))[0]
+    below, above = (bits - 1, bits + 1) if value > 0 else (bits + 1, bits - 1)
+    return (
+        struct.unpack('<d', struct.pack('<q', below))[0],
+        struct.unpack('<d', struct.pack('<q', above))[0]
+    )
+
+
+FILTERS = (
+    ('apply_alpha', ('#336699CC',)),
+    ('apply_alpha', ('#FFFFFF',)),
+    ('alpha', (0.5,)),
+    ('red', (1.3,)),
+    ('green', (0.7,)),
+    ('blue', (1.1,)),
+    ('luminance', (1.2,)),
+    ('luminance', (0.6,)),
+    ('brightness', (1.3,)),
+    ('brightness', (0.8,)),
+    ('saturation', (1.5,)),
+    ('saturation', (0.4,)),
+    ('hue', (75.0,)),
+    ('hue', (-200.0,)),
+    ('colorize', (210.0,)),
+    ('invert', ()),
+    ('grayscale', ()),
+    ('sepia', ()),
+)
+
+
+class TestRoundInt(unittest.TestCase):
+    """Test the rounding core."""
+
+    def check_round(self, value):
+        """Assert that the value rounds like the reference."""
+
+        self.assertEqual(rgba.round_int(value), decimal_round_int(value), repr(value))
+
+    def test_fractions(self):
+        """Test a dense lattice of fractions, including every half."""
+
+        for denominator in (2, 3, 4, 8, 10, 255, 1000):
+            for numerator in range(-256 * denominator, 256 * denominator + 1):
+                self.check_round(numerator / denominator)
+
+    def test_halves(self):
+        """Test the floats right next to every half."""
+
+        for numerator in range(-1023, 1024, 2):
+            half = numerator / 2.0
+            for value in neighbors(half):
+                self.check_round(value)
+
+    def test_large(self):
+        """Test values where floats can no longer hold a fraction."""
+
+        for exponent in range(50, 60):
+            for value in (2.0 ** exponent, 2.0 ** exponent - 0.5, -(2.0 ** exponent) - 0.5):
+                self.check_round(value)
+        self.check_round(0.49999999999999994)
+        self.check_round(-0.0)
+        self.check_round(7)
+
+
+class TestFilterRounding(unittest.TestCase):
+    """Test that the filters give the same colors as with the decimal rounding."""
+
+    def setUp(self):
+        """Keep the rounding so the reference can swap it."""
+
+        self.round_int = rgba.round_int
+
+    def tearDown(self):
+        """Restore the rounding."""
+
+        rgba.round_int = self.round_int
+
+    def reference(self, color, name, args):
+        """Filter the color with the reference rounding."""
+
+        rgba.round_int = decimal_round_int
+        try:
+            return self.apply(color, name, args)
+        finally:
+            rgba.round_int = self.round_int
+
+    def apply(self, color, name, args, kind=rgba.RGBA):
+        """Apply the filter and collect the results."""
+
+        color = kind(color)
+        result = getattr(color, name)(*args)
+        return result, color.get_rgba(), color.get_luminance(), color.get_true_luminance()
+
+    def check(self, colors, filters):
+        """Check both representations give the reference results."""
+
+        for color in colors:
+            for name, args in filters:
+                expected = self.reference(color, name, args)
+                for kind in (rgba.RGBA, rgba.PackedRGBA):
+                    self.assertEqual(
+                        self.apply(color, name, args, kind), expected, '%s %s %s%r' % (kind.__name__, color, name, args)
+                    )
+
+    def test_channels(self):
+        """Test parsing colors through the channel cache."""
+
+        for _ in range(2):
+            self.assertEqual(rgba.RGBA('#11223344')._split_channels('#11223344'), (0x11, 0x22, 0x33, 0x44))
+            self.assertEqual(rgba.RGBA('#abc').get_rgba(), '#AABBCCFF')
+            self.assertEqual(rgba.RGBA('#FF0080').get_rgba(), '#FF0080FF')
+            self.assertEqual(rgba.RGBA().get_rgba(), '#000000FF')
+
+    def test_filters(self):
+        """Test every filter over a sample of colors."""
+
+        steps = (0x00, 0x01, 0x33, 0x7F, 0x80, 0xCC, 0xFE, 0xFF)
+        self.check(
+            [
+                '#%02X%02X%02X%02X' % (red, green, blue, alpha)
+                for red in steps for green in steps for blue in steps[::2] for alpha in (0x00, 0x80, 0xFF)
+            ],
+            FILTERS
+        )
+
+    def alpha_colors(self, step):
+        """Get colors where each channel takes values `step` apart with every alpha."""
+
+        return [
+            '#%02X%02X%02X%02X' % (value, value ^ 0xFF, value ^ 0x5A, alpha)
+            for value in range(0, 256, step) for alpha in range(256)
+        ]
+
+    def test_channel_filters(self):
+        """Test the filters that work on each channel alone with every value they can see."""
+
+        self.check(
+            ['#%02X%02X%02X%02X' % (value, value ^ 0xFF, value ^ 0x5A, value) for value in range(256)],
+            [step for step in FILTERS if step[0] in ('alpha', 'red', 'green', 'blue', 'invert')]
+        )
+        self.check(self.alpha_colors(17), [step for step in FILTERS if step[0] == 'apply_alpha'])
+
+    @unittest.skipUnless(os.environ.get('RGBA_EXHAUSTIVE'), 'slow, set RGBA_EXHAUSTIVE=1 to run it')
+    def test_exhaustive(self):
+        """
+        Test every filter with every RGB color, and alpha blending with every channel and alpha.
+
+        Setting `RGBA_EXHAUSTIVE` to more than 1 only tests every that many RGB colors.
+        """
+
+        stride = int(os.environ['RGBA_EXHAUSTIVE'])
+        self.check(self.alpha_colors(1), [step for step in FILTERS if step[0] == 'apply_alpha'])
+        self.check(('#%06X80' % value for value in range(0, 0x1000000, stride)), FILTERS)
+
+    def test_packed_channels(self):
+        """Test setting packed channels never bleeds into their neighbors."""
+
+        color = rgba.PackedRGBA('#11223344')
+        color.r, color.a = 0xFF, 0x00
+        self.assertEqual((color.r, color.g, color.b, color.a), (0xFF, 0x22, 0x33, 0x00))
+        self.assertEqual((color.get_rgba(), color.get_rgb()), ('#FF223300', '#FF2233'))
+        for value in range(256):
+            for channel in 'rgba':
+                color = rgba.PackedRGBA('#5A5A5A5A')
+                setattr(color, channel, value)
+                self.assertEqual(
+                    [getattr(color, c) for c in 'rgba'], [value if c == channel else 0x5A for c in 'rgba']
+                )
+        self.assertEqual(rgba.PackedRGBA().get_rgba(), rgba.RGBA().get_rgba())
+        self.assertEqual(rgba.PackedRGBA('#abc').get_rgba(), '#AABBCCFF')
+        self.assertFalse(hasattr(rgba.PackedRGBA(), '__dict__'))
+
+    def test_color_info(self):
+        """Test the shared color info."""
+
+        info = rgba.get_color_info('#80808080', '#FFFFFF')
+        reference = rgba.RGBA('#80808080')
+        reference.apply_alpha('#FFFFFF')
+        self.assertEqual(info, ('#808080', reference.get_rgb(), reference.get_luminance()))
+
+
+class TestRGBAArray(unittest.TestCase):
+    """Test that batch filtering matches `RGBA`."""
+
+    FILTERS = (
+        ('apply_alpha', ('#336699CC',)),
+        ('apply_alpha', ('#FFFFFF',)),
+        ('brightness', (1.3,)),
+        ('brightness', (0.8,)),
+        ('brightness', (0.0,)),
+        ('brightness', (2.0,)),
+        ('saturation', (1.5,)),
+        ('saturation', (0.4,)),
+        ('hue', (75.0,)),
+        ('hue', (-200.0,)),
+        ('hue', (720.0,)),
+        ('invert', ()),
+        ('grayscale', ()),
+        ('sepia', ()),
+    )
+
+    def setUp(self):
+        """Make a lattice of colors."""
+
+        # Includes light colors where `colorsys` versions differ in the last bit of the saturation.
+        steps = (0, 1, 45, 90, 127, 128, 135, 165, 210, 225, 254, 255)
+        self.colors = [
+            '#%02X%02X%02X%02X' % (red, green, blue, alpha)
+            for red in steps for green in steps for blue in steps for alpha in (0x00, 0xFF)
+        ]
+
+    def check(self, vectorize):
+        """Check each filter against the scalar results."""
+
+        for name, args in self.FILTERS:
+            colors = rgba.RGBAArray(self.colors, vectorize)
+            getattr(colors, name)(*args)
+            expected = []
+            for color in self.colors:
+                color = rgba.RGBA(color)
+                getattr(color, name)(*args)
+                expected.append(color.get_rgba())
+            self.assertEqual(colors.get_rgba(), expected, '%s%r' % (name, args))
+
+    def test_vectorized(self):
+        """Test the NumPy path."""
+
+        if rgba.np is None:
+            self.skipTest('NumPy is not available')
+        self.check(True)
+
+    def test_fallback(self):
+        """Test the pure Python path."""
+
+        self.check(False)
+
+    def test_color_filter(self):
+        """Test the `color_filter` adapter."""
+
+        plist = {
+            'settings': [
+                {'settings': {'background': '#272822', 'foreground': '#F8F8F2', 'caret': '#F8F8F080'}},
+                {'scope': 'comment', 'settings': {'foreground': '#75715E', 'fontStyle': 'italic'}},
+                {'scope': 'string', 'settings': {'foreground': ' #e6db74'}}
+            ]
+        }
+        rgba.array_color_filter(['invert', ('brightness', 0.9)])(plist)
+        self.assertEqual(plist['settings'][0]['settings']['caret'], self.scalar('#F8F8F080'))
+        self.assertEqual(plist['settings'][0]['settings']['background'], self.scalar('#272822')[:-2])
+        self.assertEqual(plist['settings'][1]['settings']['fontStyle'], 'italic')
+        self.assertEqual(plist['settings'][2]['settings']['foreground'], self.scalar('#e6db74')[:-2])
+
+    def scalar(self, color):
+        """Filter the color like the adapter test does."""
+
+        color = rgba.RGBA(color)
+        color.invert()
+        color.brightness(0.9)
+        return color.get_rgba()
+
+
+class TestFilterChain(unittest.TestCase):
+    """Test compiled filter chains."""
+
+    def sequential(self, color, steps):
+        """Apply the filters one by one."""
+
+        color = rgba.RGBA(color)
+        for name, args in rgba.parse_filters(steps):
+            getattr(color, name)(*args)
+        return color.get_rgba()
+
+    def test_unfused(self):
+        """Test chains without neighboring HLS filters match the filters applied one by one."""
+
+        steps = [('saturation', 1.3), ('brightness', 0.9), ('hue', 40), 'sepia', ('luminance', 1.1), 'invert']
+        chain = rgba.FilterChain(steps)
+        self.assertEqual(len(chain.stages), 6)
+        for value in range(0, 0x1000000, 0x010305):
+            color = '#%06X80' % value
+            self.assertEqual(chain.apply(color), self.sequential(color, steps))
+
+    def test_fused(self):
+        """Test neighboring HLS filters share one HLS conversion."""
+
+        chain = rgba.FilterChain([('saturation', 1.2), ('hue', 15), ('colorize', 90), ('luminance', 0.8), 'invert'])
+        self.assertEqual(len(chain.stages), 2)
+        for value in range(0, 0x1000000, 0x010305):
+            color = '#%06X' % value
+            expected = rgba.RGBA(color)
+            hls = expected.tohls()
+            hls = rgba.hls_luminance(rgba.hls_colorize(rgba.hls_hue(rgba.hls_saturation(hls, 1.2), 15), 90), 0.8)
+            expected.fromhls(*hls)
+            expected.invert()
+            self.assertEqual(chain.apply(color), expected.get_rgb())
+
+    def test_color_filter(self):
+        """Test filtering a scheme, applying each unique color once."""
+
+        steps = [('brightness', 1.1)]
+        chain = rgba.FilterChain(steps)
+        plist = {
+            'settings': [
+                {'settings': {'background': '#272822', 'foreground': '#F8F8F2'}},
+                {'scope': 'comment', 'settings': {'foreground': '#272822', 'fontStyle': 'italic'}},
+                {'scope': 'string', 'settings': {'foreground': '#E6DB7480'}}
+            ]
+        }
+        chain(plist)
+        self.assertEqual(len(chain.cache), 3)
+        self.assertEqual(plist['settings'][1]['settings']['foreground'], self.sequential('#272822', steps)[:-2])
+        self.assertEqual(plist['settings'][2]['settings']['foreground'], self.sequential('#E6DB7480', steps))
+
+    def test_signature(self):
+        """Test chains are identified by their steps."""
+
+        self.assertEqual(
+            rgba.FilterChain(['invert', ('hue', 15)]).signature,
+            rgba.FilterChain([('invert',), ['hue', 15]]).signature
+        )
+        self.assertNotEqual(rgba.FilterChain([('hue', 15)]).signature, rgba.FilterChain([('hue', 16)]).signature)
+        self.assertRaises(ValueError, rgba.FilterChain, [('blur', 2)])
+
+
+class TestContrast(unittest.TestCase):
+    """Test WCAG contrast."""
+
+    def test_luminance(self):
+        """Test relative luminance."""
+
+        self.assertEqual(rgba.get_relative_luminance('#000000'), 0.0)
+        self.assertAlmostEqual(rgba.get_relative_luminance('#FFFFFF'), 1.0)
+        self.assertAlmostEqual(rgba.get_relative_luminance('#FF0000'), 0.2126)
+        self.assertAlmostEqual(rgba.get_relative_luminance('#808080'), 0.2158605, places=6)
+
+    def test_ratio(self):
+        """Test contrast ratios."""
+
+        self.assertAlmostEqual(rgba.get_contrast_ratio('#000000', '#FFFFFF'), 21.0)
+        self.assertAlmostEqual(rgba.get_contrast_ratio('#FFFFFF', '#000000'), 21.0)
+        self.assertAlmostEqual(rgba.get_contrast_ratio('#777777', '#FFFFFF'), 4.478, places=3)
+        self.assertEqual(rgba.get_contrast_ratio('#336699', '#336699'), 1.0)
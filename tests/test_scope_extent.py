@@ -0,0 +1,69 @@
+"""Test finding scope extents."""
+import unittest
+import random
+from . import fakes
+from lib.scope_extent import get_scope_extent
+
+ATOMS = ('string.quoted', 'constant.numeric', 'meta.function', 'comment.line', 'keyword')
+
+
+def nested_scopes(rand, size):
+    """Get the scopes of `size` characters with randomly nested scope names."""
+
+    scopes = []
+    stack = ['source.python']
+    while len(scopes) < size:
+        action = rand.random()
+        if action < 0.15 and len(stack) < 4:
+            stack.append(rand.choice([atom for atom in ATOMS if atom not in stack]))
+        elif action < 0.3 and len(stack) > 1:
+            stack.pop()
+        scopes.extend([' '.join(stack) + ' '] * rand.randint(1, 4))
+    return scopes[:size]
+
+
+def scan_extent(view, pt):
+    """Find the extent the way it used to be found, by scanning every region matching the scope."""
+
+    file_end = view.size()
+    for region in view.find_by_selector(view.scope_name(pt)):
+        if region.contains(pt) or (pt == file_end and region.end() == pt):
+            return region
+    return fakes.Region(pt)
+
+
+class TestScopeExtent(unittest.TestCase):
+    """Test expanding out from the point finds the same extents as scanning the whole view."""
+
+    def check(self, scopes):
+        """Check the extent of every point, including the end of the view."""
+
+        view = fakes.View('x' * len(scopes), lambda text: list(scopes))
+        for pt in range(view.size() + 1):
+            self.assertEqual(get_scope_extent(view, pt, view.scope_name(pt)), scan_extent(view, pt), (pt, scopes))
+
+    def test_random(self):
+        """Test randomly nested scopes."""
+
+        rand = random.Random(3)
+        for _ in range(200):
+            self.check(nested_scopes(rand, rand.randint(1, 60)))
+
+    def test_end(self):
+        """Test the end of the view takes the extent ending there."""
+
+        view = fakes.View('ab', lambda text: ['source ', 'source string '])
+        self.assertEqual(get_scope_extent(view, 2, view.scope_name(2)), fakes.Region(1, 2))
+        view = fakes.View('', lambda text: [])
+        self.assertEqual(get_scope_extent(view, 0, view.scope_name(0)), fakes.Region(0))
+
+    def test_cost(self):
+        """Test only the neighbors of the point are visited."""
+
+        scopes = nested_scopes(random.Random(1), 20000)
+        view = fakes.View('x' * len(scopes), lambda text: list(scopes))
+        calls = []
+        match_selector = view.match_selector
+        view.match_selector = lambda pt, selector: calls.append(pt) or match_selector(pt, selector)
+        extent = get_scope_extent(view, 10000, view.scope_name(10000))
+        self.assertLess(len(calls), extent.size() + 2)
@@ -0,0 +1,64 @@
+"""Test scope selectors."""
+import unittest
+from lib import scope_selector
+from lib.scope_selector import compile_selector
+
+
+class TestScopeSelector(unittest.TestCase):
+    """Test scope selector scoring."""
+
+    def score(self, selector, scope):
+        """Score the scope with a compiled selector."""
+
+        return compile_selector(selector).score(scope)
+
+    def test_atoms(self):
+        """Test that matched atoms are weighted by depth."""
+
+        scope = 'source.python string.quoted.double.python '
+        self.assertEqual(self.score('source', scope), 1)
+        self.assertEqual(self.score('source.python', scope), 2)
+        self.assertEqual(self.score('string', scope), 8)
+        self.assertEqual(self.score('string.quoted', scope), 16)
+        self.assertEqual(self.score('string.quo', scope), 0)
+        self.assertEqual(self.score('comment', scope), 0)
+
+    def test_descendants(self):
+        """Test descendant chains."""
+
+        scope = 'source.python meta.function.python string.quoted.python '
+        self.assertEqual(self.score('source string', scope), 65)
+        self.assertEqual(self.score('meta string', scope), 72)
+        self.assertEqual(self.score('string source', scope), 0)
+
+    def test_operators(self):
+        """Test the selector operators."""
+
+        scope = 'source.python comment.line.python '
+        self.assertEqual(self.score('string, comment', scope), 8)
+        self.assertEqual(self.score('string | comment', scope), 8)
+        self.assertEqual(self.score('source - comment', scope), 0)
+        self.assertEqual(self.score('source - string', scope), 1)
+        self.assertEqual(self.score('source & comment.line', scope), 16)
+        self.assertEqual(self.score('source & string', scope), 0)
+        self.assertEqual(self.score('(string, comment) & source', scope), 8)
+        self.assertEqual(self.score('(string, comment) source', scope), 8)
+        self.assertEqual(self.score('- string', scope), 1)
+        self.assertEqual(self.score('', scope), 0)
+
+    def test_required(self):
+        """Test the scope names a selector requires."""
+
+        self.assertEqual(compile_selector('source string.quoted').required(), set(['string.quoted']))
+        self.assertEqual(compile_selector('a - b, c & d').required(), set(['a', 'c']))
+        self.assertEqual(compile_selector('(a, b) c').required(), set(['a', 'b']))
+        self.assertIsNone(compile_selector('- comment').required())
+
+    def test_compile_cache(self):
+        """Test compiled selectors are shared, but the cache stays bounded."""
+
+        self.assertIs(compile_selector('string.quoted'), compile_selector('string.quoted'))
+        for i in range(scope_selector.COMPILE_CACHE_SIZE + 10):
+            compile_selector('string.quoted.x%d' % i)
+        self.assertEqual(len(scope_selector._compiled), scope_selector.COMPILE_CACHE_SIZE)
+        self.assertNotIn('string.quoted', scope_selector._compiled)
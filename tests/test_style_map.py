@@ -0,0 +1,114 @@
+"""Test the style map."""
+import unittest
+import random
+from collections import namedtuple
+from . import fakes
+from lib import style_map
+
+Match = namedtuple('Match', ['fg', 'fg_simulated', 'bg', 'bg_simulated', 'style'])
+
+# Strings share the style of plain source.
+STYLES = {
+    'source ': Match('#000000', '#000000', '#FFFFFF', '#FFFFFF', ''),
+    'source string ': Match('#000000', '#000000', '#FFFFFF', '#FFFFFF', ''),
+    'source constant ': Match('#FF0000', '#FF0000', '#FFFFFF', '#FFFFFF', 'bold')
+}
+
+
+def scope_text(text):
+    """Scope double quoted strings, which can span lines, and digits."""
+
+    scopes = []
+    quoted = False
+    for c in text:
+        if c == '"':
+            scopes.append('source string ')
+            quoted = not quoted
+        elif quoted:
+            scopes.append('source string ')
+        elif c.isdigit():
+            scopes.append('source constant ')
+        else:
+            scopes.append('source ')
+    return scopes
+
+
+class Matcher(object):
+    """Color scheme matcher with fixed styles."""
+
+    def guess_color(self, view, pt, scope):
+        """Get the style of the scope."""
+
+        return STYLES[scope]
+
+
+class TestStyleMap(unittest.TestCase):
+    """Test incremental updates give the same map as mapping the whole view."""
+
+    def built(self, view):
+        """Map the whole view from scratch."""
+
+        smap = style_map.StyleMap(Matcher())
+        smap.build(view)
+        return smap
+
+    def edit(self, smap, view, begin, removed, text):
+        """Replace `removed` characters at `begin` with the text and update the map."""
+
+        view.set_text(view.text[:begin] + text + view.text[begin + removed:])
+        smap.update(view, begin, begin + len(text), len(text) - removed)
+
+    def assert_same(self, smap, view):
+        """Assert the map agrees with a fresh map of the view."""
+
+        expected = self.built(view)
+        self.assertEqual(list(smap.scope_runs()), list(expected.scope_runs()), repr(view.text))
+        self.assertEqual(list(smap), list(expected), repr(view.text))
+
+    def test_shared_style(self):
+        """Test lines whose scopes change to ones sharing their style are rescanned."""
+
+        view = fakes.View('x\nab\n1\n', scope_text)
+        smap = self.built(view)
+        self.edit(smap, view, 0, 0, '"')
+        self.assert_same(smap, view)
+        self.assertEqual(list(smap.scope_runs()), [(0, 8, 'source string ')])
+        self.assertEqual([(s, e) for s, e, style in smap], [(0, 8)])
+
+    def test_random_edits(self):
+        """Test random edits."""
+
+        rand = random.Random(11)
+        for _ in range(50):
+            view = fakes.View(''.join(rand.choice('ab1"\n ') for _ in range(rand.randint(0, 40))), scope_text)
+            smap = self.built(view)
+            for _ in range(20):
+                begin = rand.randint(0, view.size())
+                removed = rand.randint(0, min(3, view.size() - begin))
+                text = ''.join(rand.choice('ab1"\n ') for _ in range(rand.randint(0, 3)))
+                self.edit(smap, view, begin, removed, text)
+                self.assert_same(smap, view)
+
+    def test_style_at(self):
+        """Test looking up the style of a point."""
+
+        view = fakes.View('a 12\n', scope_text)
+        smap = self.built(view)
+        self.assertEqual(smap.style_at(0), style_map.TextStyle(*STYLES['source ']))
+        self.assertEqual(smap.style_at(3), style_map.TextStyle(*STYLES['source constant ']))
+        self.assertIsNone(smap.style_at(5))
+
+    def test_scan_style_runs(self):
+        """Test scanning a few lines agrees with the map of the whole view, and only scans those lines."""
+
+        view = fakes.View('a "1\nb" 22\n"x"\n', scope_text)
+        expected = self.built(view)
+        scanned = []
+        scope_name = view.scope_name
+        view.scope_name = lambda pt: scanned.append(pt) or scope_name(pt)
+        smap = style_map.StyleMap(Matcher())
+        for begin, end in ((0, 4), (5, 10), (11, 14)):
+            del scanned[:]
+            self.assertEqual(list(smap.scan_style_runs(view, begin, end)), list(expected.style_runs(begin, end)))
+            self.assertEqual((min(scanned), max(scanned)), (begin, end - 1))
+        self.assertEqual(smap.size, 0)